@@ -0,0 +1,67 @@
+"""document_ingestion_status
+
+Revision ID: 8c2f4e1a9b3d
+Revises: 366208dd463a
+Create Date: 2026-10-17 09:12:44.318021
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision: str = '8c2f4e1a9b3d'
+down_revision: Union[str, Sequence[str], None] = '366208dd463a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+NEW_COLUMNS = [
+    sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+    sa.Column('job_id', sa.String(), nullable=True),
+    sa.Column('pages_extracted', sa.Integer(), nullable=True, server_default='0'),
+    sa.Column('chunks_total', sa.Integer(), nullable=True, server_default='0'),
+    sa.Column('chunks_embedded', sa.Integer(), nullable=True, server_default='0'),
+    sa.Column('points_stored', sa.Integer(), nullable=True, server_default='0'),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+]
+
+
+def _columns(table: str) -> set:
+    inspector = sa.inspect(op.get_bind())
+    if table not in inspector.get_table_names():
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = _columns('documents')
+    if not existing:
+        # Tables are created by Base.metadata.create_all on fresh deployments
+        return
+
+    for column in NEW_COLUMNS:
+        if column.name not in existing:
+            op.add_column('documents', column)
+
+    if 'processed' in existing:
+        op.execute("UPDATE documents SET status = CASE WHEN processed THEN 'ready' ELSE 'failed' END")
+        op.drop_column('documents', 'processed')
+
+    op.create_index('ix_documents_status', 'documents', ['status'], if_not_exists=True)
+    op.create_index('ix_documents_job_id', 'documents', ['job_id'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('documents', sa.Column('processed', sa.Boolean(), nullable=True, server_default=sa.false()))
+    op.execute("UPDATE documents SET processed = (status = 'ready')")
+
+    op.drop_index('ix_documents_job_id', table_name='documents', if_exists=True)
+    op.drop_index('ix_documents_status', table_name='documents', if_exists=True)
+    for column in reversed(NEW_COLUMNS):
+        op.drop_column('documents', column.name)
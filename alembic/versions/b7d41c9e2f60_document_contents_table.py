@@ -0,0 +1,122 @@
+"""document_contents_table
+
+Revision ID: b7d41c9e2f60
+Revises: 8c2f4e1a9b3d
+Create Date: 2026-10-17 14:03:27.552190
+
+"""
+from typing import Sequence, Union
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision: str = 'b7d41c9e2f60'
+down_revision: Union[str, Sequence[str], None] = '8c2f4e1a9b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Rows copied per round trip while moving existing content
+COPY_BATCH_SIZE = 200
+
+documents = sa.table(
+    'documents',
+    sa.column('id', sa.Integer()),
+    sa.column('content', sa.Text()),
+)
+document_contents = sa.table(
+    'document_contents',
+    sa.column('document_id', sa.Integer()),
+    sa.column('data', sa.LargeBinary()),
+    sa.column('compression', sa.String()),
+    sa.column('original_size', sa.Integer()),
+    sa.column('compressed_size', sa.Integer()),
+)
+
+
+def _columns(table: str) -> set:
+    inspector = sa.inspect(op.get_bind())
+    if table not in inspector.get_table_names():
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = _columns('documents')
+    if not existing:
+        # Tables are created by Base.metadata.create_all on fresh deployments
+        return
+
+    if not _columns('document_contents'):
+        op.create_table(
+            'document_contents',
+            sa.Column('document_id', sa.Integer(), sa.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('data', sa.LargeBinary(), nullable=False),
+            sa.Column('compression', sa.String(), nullable=False, server_default='zlib'),
+            sa.Column('original_size', sa.Integer(), nullable=True),
+            sa.Column('compressed_size', sa.Integer(), nullable=True),
+        )
+
+    if 'content' not in existing:
+        return
+
+    # Move existing text in id-ordered batches, compressing it on the way
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(documents.c.id, documents.c.content)
+            .where(documents.c.id > last_id, documents.c.content.isnot(None))
+            .order_by(documents.c.id)
+            .limit(COPY_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        records = []
+        for document_id, content in rows:
+            raw = content.encode('utf-8')
+            data = zlib.compress(raw, 6)
+            records.append({
+                'document_id': document_id,
+                'data': data,
+                'compression': 'zlib',
+                'original_size': len(raw),
+                'compressed_size': len(data),
+            })
+        bind.execute(document_contents.insert(), records)
+        last_id = rows[-1][0]
+
+    op.drop_column('documents', 'content')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('documents', sa.Column('content', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(document_contents.c.document_id, document_contents.c.data, document_contents.c.compression)
+            .where(document_contents.c.document_id > last_id)
+            .order_by(document_contents.c.document_id)
+            .limit(COPY_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        for document_id, data, compression in rows:
+            raw = zlib.decompress(data) if compression == 'zlib' else data
+            bind.execute(
+                documents.update()
+                .where(documents.c.id == document_id)
+                .values(content=raw.decode('utf-8'))
+            )
+        last_id = rows[-1][0]
+
+    op.drop_table('document_contents')
@@ -0,0 +1,62 @@
+"""document_content_hash
+
+Revision ID: d3e8a5f17c42
+Revises: b7d41c9e2f60
+Create Date: 2026-10-17 16:41:08.203915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision: str = 'd3e8a5f17c42'
+down_revision: Union[str, Sequence[str], None] = 'b7d41c9e2f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rows covered by the unique index (failed documents may be uploaded again)
+UNIQUE_CONTENT_PREDICATE = "content_hash IS NOT NULL AND status != 'failed'"
+
+
+def _columns(table: str) -> set:
+    inspector = sa.inspect(op.get_bind())
+    if table not in inspector.get_table_names():
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = _columns('documents')
+    if not existing:
+        # Tables are created by Base.metadata.create_all on fresh deployments
+        return
+
+    # Existing rows keep a NULL hash and are simply never matched as duplicates
+    if 'content_hash' not in existing:
+        op.add_column('documents', sa.Column('content_hash', sa.String(64), nullable=True))
+
+    # Only the oldest live copy of a content keeps its hash, so the index can be unique
+    op.execute(
+        "UPDATE documents SET content_hash = NULL "
+        f"WHERE {UNIQUE_CONTENT_PREDICATE} AND id NOT IN ("
+        f"SELECT MIN(id) FROM documents WHERE {UNIQUE_CONTENT_PREDICATE} GROUP BY user_id, content_hash)"
+    )
+    op.drop_index('ix_documents_user_content_hash', table_name='documents', if_exists=True)
+    op.create_index(
+        'ix_documents_user_content_hash',
+        'documents',
+        ['user_id', 'content_hash'],
+        unique=True,
+        postgresql_where=sa.text(UNIQUE_CONTENT_PREDICATE),
+        sqlite_where=sa.text(UNIQUE_CONTENT_PREDICATE),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_documents_user_content_hash', table_name='documents', if_exists=True)
+    op.drop_column('documents', 'content_hash')
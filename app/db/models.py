@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, Text, LargeBinary, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 from datetime import datetime
+from typing import Optional
 import bcrypt
+import zlib
 
 class User(Base):
     __tablename__ = "users"
@@ -25,17 +28,148 @@ class User(Base):
         return bcrypt.checkpw(password.encode('utf-8'), self.hashed_password.encode('utf-8'))
 
 
+class DocumentStatus:
+    PENDING = "pending"
+    EXTRACTING = "extracting"
+    EMBEDDING = "embedding"
+    READY = "ready"
+    FAILED = "failed"
+
+    # Statuses of a job that has not finished (or was interrupted by a restart)
+    IN_PROGRESS = (PENDING, EXTRACTING, EMBEDDING)
+
+    # Allowed transitions of the ingestion state machine
+    TRANSITIONS = {
+        PENDING: {EXTRACTING, FAILED},
+        # Jobs interrupted by a restart are requeued from PENDING
+        EXTRACTING: {EMBEDDING, FAILED, PENDING},
+        EMBEDDING: {READY, FAILED, PENDING},
+        # Re-ingestion of an edited file starts over from PENDING
+        READY: {PENDING},
+        FAILED: {PENDING},
+    }
+
+
+# Rows covered by the per-user unique content hash index
+UNIQUE_CONTENT_PREDICATE = f"content_hash IS NOT NULL AND status != '{DocumentStatus.FAILED}'"
+
+
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # Duplicate detection on upload; unique so concurrent uploads of the same
+        # content cannot both be registered (failed documents may be uploaded again)
+        Index(
+            "ix_documents_user_content_hash",
+            "user_id",
+            "content_hash",
+            unique=True,
+            postgresql_where=text(UNIQUE_CONTENT_PREDICATE),
+            sqlite_where=text(UNIQUE_CONTENT_PREDICATE),
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     source = Column(String)
-    content = Column(Text)
     file_type = Column(String)
     file_size = Column(Integer)
-    processed = Column(Boolean, default=False)
+    # SHA-256 of the uploaded file, computed while it is written to disk
+    content_hash = Column(String(64))
+    status = Column(String, default=DocumentStatus.PENDING, nullable=False, index=True)
+    job_id = Column(String, index=True)
+    pages_extracted = Column(Integer, default=0)
+    chunks_total = Column(Integer, default=0)
+    chunks_embedded = Column(Integer, default=0)
+    points_stored = Column(Integer, default=0)
+    error_message = Column(Text)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime)
     user_id = Column(Integer, ForeignKey("users.id"))  
     
-    owner = relationship("User", back_populates="documents")
\ No newline at end of file
+    owner = relationship("User", back_populates="documents")
+    # Extracted text lives in its own table; never lazy-loaded (no implicit IO under AsyncSession),
+    # load it with selectinload(Document.content_record) or DocumentContent.get_text
+    content_record = relationship(
+        "DocumentContent",
+        uselist=False,
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    @property
+    def processed(self) -> bool:
+        return self.status == DocumentStatus.READY
+
+    def transition_to(self, new_status: str, error: str = None):
+        current = self.status or DocumentStatus.PENDING
+        if new_status not in DocumentStatus.TRANSITIONS.get(current, set()):
+            raise ValueError(f"Invalid document status transition: {current} -> {new_status}")
+
+        self.status = new_status
+        if new_status == DocumentStatus.FAILED:
+            self.error_message = error
+        elif new_status == DocumentStatus.READY:
+            self.processed_at = datetime.utcnow()
+
+class DocumentContent(Base):
+    """Full extracted text of a document, zlib-compressed"""
+    __tablename__ = "document_contents"
+
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    compression = Column(String, nullable=False, default="zlib")
+    original_size = Column(Integer)
+    compressed_size = Column(Integer)
+
+    @classmethod
+    def from_text(cls, text: str) -> "DocumentContent":
+        record = cls()
+        record.set_text(text)
+        return record
+
+    def set_text(self, text: str):
+        raw = text.encode("utf-8")
+        self.data = zlib.compress(raw, 6)
+        self.compression = "zlib"
+        self.original_size = len(raw)
+        self.compressed_size = len(self.data)
+
+    @property
+    def text(self) -> str:
+        raw = zlib.decompress(self.data) if self.compression == "zlib" else self.data
+        return raw.decode("utf-8")
+
+    @classmethod
+    async def get_text(cls, db: AsyncSession, document_id: int) -> Optional[str]:
+        """Extracted text of a document, None if it has none yet"""
+        record = await db.get(cls, document_id)
+        return record.text if record is not None else None
+
+
+class DocumentContentWriter:
+    """Builds a DocumentContent page by page; only the compressed stream is kept in memory"""
+
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level)
+        self._parts = []
+        self.pages = 0
+        self.original_size = 0
+
+    def write(self, text: str):
+        raw = (f"\n{text}" if self.pages else text).encode("utf-8")
+        self._parts.append(self._compressor.compress(raw))
+        self.pages += 1
+        self.original_size += len(raw)
+
+    def finish(self) -> DocumentContent:
+        self._parts.append(self._compressor.flush())
+        data = b"".join(self._parts)
+        self._parts = []
+        return DocumentContent(
+            data=data,
+            compression="zlib",
+            original_size=self.original_size,
+            compressed_size=len(data),
+        )
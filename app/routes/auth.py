@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from typing import Optional
@@ -8,6 +9,8 @@ from typing import Optional
 from app.db.database import get_db
 from app.db import models
 from app.schemas import auth_schemas
+from app.services.password_hasher import password_hasher
+from app.services.user_cache import user_cache
 from config import settings
 
 router = APIRouter()
@@ -30,7 +33,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -44,19 +47,24 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.email == email).first()
+
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+
+    user = await db.scalar(select(models.User).where(models.User.email == email))
     if user is None:
         raise credentials_exception
+    user_cache.set(user)
     return user
 
 @router.post("/token", response_model=auth_schemas.Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not user.check_password(form_data.password):
+    user = await db.scalar(select(models.User).where(models.User.email == form_data.username))
+    if not user or not await password_hasher.check_password(user, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -73,10 +81,10 @@ async def login_for_access_token(
 @router.post("/register", response_model=auth_schemas.User)
 async def register_user(
     user_data: auth_schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     
-    existing_user = db.query(models.User).filter(models.User.email == user_data.email).first()
+    existing_user = await db.scalar(select(models.User).where(models.User.email == user_data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -88,11 +96,11 @@ async def register_user(
         email=user_data.email,
         full_name=user_data.full_name
     )
-    new_user.set_password(user_data.password)
+    await password_hasher.set_password(new_user, user_data.password)
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return new_user
 
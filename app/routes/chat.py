@@ -1,12 +1,18 @@
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Depends, Body
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.database import get_db
-from app.services.retrieval import RetrievalService
-from app.services.llm_service import LLMService
-from app.services.embeddings import EmbeddingService
-from qdrant_client import QdrantClient
+from app.services.retrieval import SEARCH_MODES, retrieval_service
+from app.services.llm_service import llm_service
+from app.services.context_packer import context_packer
+from app.services.llm_dispatcher import PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMRateLimitedError
+from app.services.embeddings import embedding_service
+from app.services.answer_cache import answer_cache
+from app.services.redis_service import cache_response
 from config import settings
+import asyncio
+import json
 import time
 from datetime import datetime
 from app.db import models
@@ -14,14 +20,120 @@ from app.routes.auth import get_current_user
 
 router = APIRouter()
 
-qdrant_client = QdrantClient(
-    host=settings.QDRANT_HOST,
-    port=settings.QDRANT_PORT
-)
+def _without_sources(response_data: dict) -> dict:
+    response_data["sources"] = []
+    response_data.pop("llm_sources", None)
+    return response_data
 
-embedding_service = EmbeddingService()
-retrieval_service = RetrievalService(qdrant_client, embedding_service)
-llm_service = LLMService()
+def _build_sources(chunks: List[dict], documents: List[dict]) -> List[dict]:
+    """Source entries for the chunks used as context"""
+    documents_by_id = {doc["id"]: doc for doc in documents}
+    sources_with_context = []
+    for chunk in chunks:
+        doc = documents_by_id.get(chunk["document_id"])
+        if doc:
+            sources_with_context.append({
+                "id": f"{chunk['document_id']}-{chunk['chunk_index']}",
+                "score": chunk["score"],
+                "text": chunk["text"],
+                "document_id": chunk["document_id"],
+                "title": doc["title"],
+                "chunk_index": chunk["chunk_index"]
+            })
+    return sources_with_context
+
+def _sse(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _from_cache(cached_response: dict, question: str, start_time: float) -> dict:
+    cached_response.update({
+        "question": question,
+        "cached": True,
+        "retrieval_time": "0.00s",
+        "llm_time": "0s",
+        "total_time": f"{time.time() - start_time:.2f}s",
+        "timestamp": datetime.now().isoformat(),
+    })
+    return cached_response
+
+def _no_context_response(question: str, start_time: float, retrieval_time: float) -> dict:
+    return {
+        "question": question,
+        "answer": "I couldn't find relevant information in your documents to answer your question.",
+        "sources": [],
+        "confidence": 0,
+        "context_available": False,
+        "retrieval_time": f"{retrieval_time - start_time:.2f}s",
+        "llm_time": "0s",
+        "total_time": f"{time.time() - start_time:.2f}s",
+        "timestamp": datetime.now().isoformat(),
+        "success": True,
+    }
+
+async def _answer_with_context(
+    question: str,
+    context_data: dict,
+    response_style: str,
+    start_time: float,
+    retrieval_time: float,
+    user_id: int,
+    query_embedding: Optional[List[float]],
+    cache_namespace: Optional[str],
+    priority: int = PRIORITY_INTERACTIVE
+) -> dict:
+    """Pack the retrieved context, generate the answer and cache it"""
+    # Pack context for LLM within the prompt token budget
+    packed_context = context_packer.pack(
+        context_data["contexts"],
+        reserved_tokens=llm_service.reserved_tokens(question, response_style),
+    )
+
+    # Generate response with LLM
+    llm_start = time.time()
+    llm_response = await llm_service.generate_answer(
+        query=question,
+        context=packed_context.text,
+        response_style=response_style,
+        priority=priority,
+        user_id=user_id,
+    )
+
+    llm_time = time.time()
+    total_time = time.time() - start_time
+
+    # Prepare sources with used chunks
+    sources_with_context = _build_sources(packed_context.chunks, context_data["documents"])
+
+    # Prepare final response
+    response_data = {
+        "question": question,
+        "answer": llm_response["answer"],
+        "sources": sources_with_context,
+        "retrieved_chunks": len(context_data["contexts"]),
+        **packed_context.get_stats(),
+        "confidence": context_data["max_score"],
+        "fused_score": context_data.get("max_fused_score"),
+        "response_style": response_style,
+        "context_available": True,
+        "retrieval_time": f"{retrieval_time - start_time:.2f}s",
+        "llm_time": f"{llm_time - llm_start:.2f}s",
+        "total_time": f"{total_time:.2f}s",
+        "timestamp": datetime.now().isoformat(),
+        "success": llm_response["success"],
+    }
+
+    if llm_response.get("sources"):
+        response_data["llm_sources"] = llm_response["sources"]
+
+    if llm_response.get("error") == "rate_limited":
+        response_data["error"] = "rate_limited"
+        response_data["retry_after"] = llm_response.get("retry_after")
+
+    if llm_response["success"] and not llm_response.get("is_mock"):
+        await answer_cache.store(cache_namespace, query_embedding, response_data)
+
+    return response_data
 
 @router.post("/chat/ask")
 async def ask_question(
@@ -29,7 +141,10 @@ async def ask_question(
     max_results: int = Body(5),
     response_style: str = Body("concise"),
     include_sources: bool = Body(True),
-    db: Session = Depends(get_db),
+    search_mode: Optional[str] = Body(None),
+    use_mmr: Optional[bool] = Body(None),
+    mmr_lambda: Optional[float] = Body(None, ge=0.0, le=1.0),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """Ask a question and get an answer based on documents"""
@@ -39,97 +154,314 @@ async def ask_question(
         if not question or not question.strip():
             raise HTTPException(400, "Question cannot be empty")
 
+        if search_mode and search_mode not in SEARCH_MODES:
+            raise HTTPException(400, f"search_mode must be one of: {', '.join(SEARCH_MODES)}")
+        retrieval_options = {"search_mode": search_mode, "use_mmr": use_mmr, "mmr_lambda": mmr_lambda}
+
+        # 0. Semantic answer cache, scoped to the user's current document set
+        query_embedding = await embedding_service.embed_query(question)
+        cached_response, cache_namespace = await answer_cache.lookup(
+            current_user.id, query_embedding, response_style, max_results, **retrieval_options
+        )
+        if cached_response is not None:
+            cached_response = _from_cache(cached_response, question, start_time)
+            return cached_response if include_sources else _without_sources(cached_response)
+
         # 1. Retrieve context filtered by user
         context_data = await retrieval_service.retrieve_document_context(
             db=db,
             query=question,
             max_chunks=max_results,
-            user_id=current_user.id
+            user_id=current_user.id,
+            **retrieval_options
         )
 
         retrieval_time = time.time()
 
         if not context_data["contexts"]:
-            return {
+            return _no_context_response(question, start_time, retrieval_time)
+
+        response_data = await _answer_with_context(
+            question, context_data, response_style, start_time, retrieval_time,
+            current_user.id, query_embedding, cache_namespace
+        )
+
+        if response_data.get("error") == "rate_limited":
+            retry_after = response_data.get("retry_after")
+            raise HTTPException(
+                429,
+                response_data["answer"],
+                headers={"Retry-After": str(int(retry_after or 5))},
+            )
+
+        return response_data if include_sources else _without_sources(response_data)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Error during processing: {str(e)}")
+
+@router.post("/chat/ask/stream")
+async def ask_question_stream(
+    question: str = Body(..., embed=True),
+    max_results: int = Body(5),
+    response_style: str = Body("concise"),
+    include_sources: bool = Body(True),
+    search_mode: Optional[str] = Body(None),
+    use_mmr: Optional[bool] = Body(None),
+    mmr_lambda: Optional[float] = Body(None, ge=0.0, le=1.0),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Ask a question and stream the answer as server-sent events:
+    `sources` first, then one `token` event per text delta, then `done`
+    with timings (including time to first token) and extracted citations.
+    """
+    start_time = time.time()
+
+    if not question or not question.strip():
+        raise HTTPException(400, "Question cannot be empty")
+
+    if search_mode and search_mode not in SEARCH_MODES:
+        raise HTTPException(400, f"search_mode must be one of: {', '.join(SEARCH_MODES)}")
+    retrieval_options = {"search_mode": search_mode, "use_mmr": use_mmr, "mmr_lambda": mmr_lambda}
+
+    # Retrieval runs before the response starts so the DB session is not held while streaming
+    query_embedding = await embedding_service.embed_query(question)
+    cached_response, cache_namespace = await answer_cache.lookup(
+        current_user.id, query_embedding, response_style, max_results, **retrieval_options
+    )
+    context_data = None
+    if cached_response is None:
+        context_data = await retrieval_service.retrieve_document_context(
+            db=db,
+            query=question,
+            max_chunks=max_results,
+            user_id=current_user.id,
+            **retrieval_options
+        )
+    retrieval_time = time.time()
+
+    async def events():
+        if cached_response is not None:
+            yield _sse("sources", {
+                "sources": cached_response["sources"] if include_sources else [],
+                "confidence": cached_response.get("confidence", 0),
+                "context_available": True,
+            })
+            yield _sse("token", {"text": cached_response["answer"]})
+            yield _sse("done", {
                 "question": question,
-                "answer": "I couldn't find relevant information in your documents to answer your question.",
-                "sources": [],
-                "confidence": 0,
-                "context_available": False,
-                "retrieval_time": f"{retrieval_time - start_time:.2f}s",
+                "llm_sources": cached_response.get("llm_sources", []),
+                "cached": True,
+                "retrieval_time": "0.00s",
+                "time_to_first_token": f"{time.time() - start_time:.2f}s",
                 "llm_time": "0s",
                 "total_time": f"{time.time() - start_time:.2f}s",
                 "timestamp": datetime.now().isoformat(),
                 "success": True,
-            }
+            })
+            return
 
-        # 2. Format context for LLM
-        formatted_context = retrieval_service.format_context_for_llm(
-            context_data["contexts"]
-        )
+        if not context_data["contexts"]:
+            answer = "I couldn't find relevant information in your documents to answer your question."
+            yield _sse("sources", {"sources": [], "confidence": 0, "context_available": False})
+            yield _sse("token", {"text": answer})
+            yield _sse("done", {
+                "question": question,
+                "llm_sources": [],
+                "retrieval_time": f"{retrieval_time - start_time:.2f}s",
+                "time_to_first_token": f"{time.time() - start_time:.2f}s",
+                "llm_time": "0s",
+                "total_time": f"{time.time() - start_time:.2f}s",
+                "timestamp": datetime.now().isoformat(),
+                "success": True,
+            })
+            return
 
-        # 3. Generate response with LLM
-        llm_response = await llm_service.generate_answer(
-            query=question,
-            context=formatted_context,
-            response_style=response_style,
+        packed_context = context_packer.pack(
+            context_data["contexts"],
+            reserved_tokens=llm_service.reserved_tokens(question, response_style),
         )
-
-        llm_time = time.time()
-        total_time = time.time() - start_time
-
-        # Prepare sources with used chunks
-        sources_with_context = []
-        for chunk in context_data["contexts"]:
-            doc = next((d for d in context_data["documents"] if d["id"] == chunk["document_id"]), None)
-            if doc:
-                sources_with_context.append({
-                    "id": f"{chunk['document_id']}-{chunk['chunk_index']}",
-                    "score": chunk["score"],
-                    "text": chunk["text"],
-                    "document_id": chunk["document_id"],
-                    "title": doc["title"],
-                    "chunk_index": chunk["chunk_index"]
-                })
-
-        # Prepare final response
-        response_data = {
-            "question": question,
-            "answer": llm_response["answer"],
+        sources_with_context = _build_sources(packed_context.chunks, context_data["documents"])
+        yield _sse("sources", {
             "sources": sources_with_context if include_sources else [],
             "retrieved_chunks": len(context_data["contexts"]),
             "confidence": context_data["max_score"],
-            "response_style": response_style,
+            "fused_score": context_data.get("max_fused_score"),
             "context_available": True,
+            **packed_context.get_stats(),
+        })
+
+        answer_parts = []
+        first_token_time = None
+        success = True
+        try:
+            async for delta in llm_service.stream_answer(
+                question, packed_context.text, response_style, user_id=current_user.id
+            ):
+                if first_token_time is None:
+                    first_token_time = time.time()
+                answer_parts.append(delta)
+                yield _sse("token", {"text": delta})
+        except LLMRateLimitedError as e:
+            success = False
+            yield _sse("error", {
+                "detail": "The language model is receiving too many requests right now. Please try again in a few seconds.",
+                "retry_after": e.retry_after,
+            })
+        except Exception as e:
+            success = False
+            yield _sse("error", {"detail": f"Error during generation: {str(e)}"})
+
+        llm_time = time.time()
+        answer = "".join(answer_parts).strip()
+        llm_sources = llm_service.extract_sources(answer)
+        yield _sse("done", {
+            "question": question,
+            "llm_sources": llm_sources,
             "retrieval_time": f"{retrieval_time - start_time:.2f}s",
+            "time_to_first_token": f"{first_token_time - start_time:.2f}s" if first_token_time else None,
             "llm_time": f"{llm_time - retrieval_time:.2f}s",
-            "total_time": f"{total_time:.2f}s",
+            "total_time": f"{llm_time - start_time:.2f}s",
             "timestamp": datetime.now().isoformat(),
-            "success": llm_response["success"],
-        }
+            "success": success,
+        })
 
-        if include_sources and llm_response.get("sources"):
-            response_data["llm_sources"] = llm_response["sources"]
+        if success and answer and not llm_service.use_mock:
+            response_data = {
+                "question": question,
+                "answer": answer,
+                "sources": sources_with_context,
+                "retrieved_chunks": len(context_data["contexts"]),
+                **packed_context.get_stats(),
+                "confidence": context_data["max_score"],
+                "fused_score": context_data.get("max_fused_score"),
+                "response_style": response_style,
+                "context_available": True,
+                "success": True,
+            }
+            if llm_sources:
+                response_data["llm_sources"] = llm_sources
+            await answer_cache.store(cache_namespace, query_embedding, response_data)
 
-        return response_data
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    except Exception as e:
-        raise HTTPException(500, f"Error during processing: {str(e)}")
+@router.post("/chat/ask/batch")
+async def ask_questions_batch(
+    questions: List[str] = Body(..., embed=True),
+    max_results: int = Body(5),
+    response_style: str = Body("concise"),
+    include_sources: bool = Body(True),
+    search_mode: Optional[str] = Body(None),
+    use_mmr: Optional[bool] = Body(None),
+    mmr_lambda: Optional[float] = Body(None, ge=0.0, le=1.0),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Answer many questions in one call, streamed back as NDJSON in completion order.
+    Each line is a /chat/ask response with the question's position as "index".
+    """
+    start_time = time.time()
+
+    if not questions:
+        raise HTTPException(400, "Questions cannot be empty")
+
+    if len(questions) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(400, f"At most {settings.BATCH_MAX_QUESTIONS} questions per batch")
+
+    if search_mode and search_mode not in SEARCH_MODES:
+        raise HTTPException(400, f"search_mode must be one of: {', '.join(SEARCH_MODES)}")
+    retrieval_options = {"search_mode": search_mode, "use_mmr": use_mmr, "mmr_lambda": mmr_lambda}
+
+    # One embedding call and one Qdrant batch search for the whole batch, before streaming starts
+    query_embeddings = await embedding_service.embed_queries(questions)
+    lookups = await asyncio.gather(*(
+        answer_cache.lookup(current_user.id, embedding, response_style, max_results, **retrieval_options)
+        for embedding in query_embeddings
+    ))
+    cached_responses = [cached for cached, _ in lookups]
+    cache_namespaces = [namespace for _, namespace in lookups]
+
+    pending = [
+        i for i, question in enumerate(questions)
+        if question.strip() and cached_responses[i] is None
+    ]
+    contexts = await retrieval_service.retrieve_document_contexts(
+        db,
+        [questions[i] for i in pending],
+        [query_embeddings[i] for i in pending],
+        max_chunks=max_results,
+        user_id=current_user.id,
+        **retrieval_options
+    )
+    context_by_index = dict(zip(pending, contexts))
+    retrieval_time = time.time()
+
+    semaphore = asyncio.Semaphore(max(1, settings.BATCH_LLM_CONCURRENCY))
+
+    async def answer(index: int) -> dict:
+        question = questions[index]
+        try:
+            if not question.strip():
+                response_data = {"question": question, "success": False, "error": "Question cannot be empty"}
+            elif cached_responses[index] is not None:
+                response_data = _from_cache(cached_responses[index], question, start_time)
+            elif not context_by_index[index]["contexts"]:
+                response_data = _no_context_response(question, start_time, retrieval_time)
+            else:
+                async with semaphore:
+                    response_data = await _answer_with_context(
+                        question, context_by_index[index], response_style, start_time, retrieval_time,
+                        current_user.id, query_embeddings[index], cache_namespaces[index],
+                        priority=PRIORITY_BATCH
+                    )
+        except Exception as e:
+            response_data = {"question": question, "success": False, "error": f"Error during processing: {str(e)}"}
+
+        response_data["index"] = index
+        return response_data if include_sources else _without_sources(response_data)
+
+    async def results():
+        tasks = [asyncio.create_task(answer(i)) for i in range(len(questions))]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+def _search_cache_key(query, limit, score_threshold, search_mode, current_user, **_):
+    return current_user.id, (query, limit, score_threshold, search_mode or settings.RETRIEVAL_SEARCH_MODE)
 
 @router.get("/chat/search")
+@cache_response("search", _search_cache_key, ttl=settings.SEARCH_CACHE_TTL)
 async def search_chunks(
     query: str,
     limit: int = 10,
     score_threshold: float = 0.3,
+    search_mode: Optional[str] = None,
     current_user: models.User = Depends(get_current_user)
 ):
     """Simple search for similar chunks"""
     try:
+        if search_mode and search_mode not in SEARCH_MODES:
+            raise HTTPException(400, f"search_mode must be one of: {', '.join(SEARCH_MODES)}")
+
         results = await retrieval_service.search_similar_chunks(
             query=query,
             limit=limit,
             score_threshold=score_threshold,
-            user_id=current_user.id
+            user_id=current_user.id,
+            search_mode=search_mode
         )
 
         return {
@@ -140,6 +472,8 @@ async def search_chunks(
             "timestamp": datetime.now().isoformat(),
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Search error: {str(e)}")
 
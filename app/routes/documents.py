@@ -1,122 +1,475 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import FormData, UploadFile as StarletteUploadFile
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import SessionLocal, get_db
 from app.db import models
-from app.services.ingestion import DocumentProcessor
+from app.db.models import DocumentStatus
 from app.services.embeddings import embedding_service
+from app.services.job_queue import IngestionJob, document_processor, ingestion_queue
+from app.services.bulk_upload import FileTooLargeError, SpooledFile, is_archive, iter_archive, spool_file
+from app.services.redis_service import cache_response, invalidate_user
+from config import settings
+from app.services.document_metadata import document_metadata_cache
+from app.services.vector_store import get_qdrant_client
+from qdrant_client import AsyncQdrantClient
 from app.routes.auth import get_current_user
-import shutil
+import asyncio
+import json
 import os
-from typing import List
+import time
+from typing import Dict, Iterable, Iterator, List, Set, Union
 import traceback
 import uuid
 from datetime import datetime
 
 router = APIRouter()
-document_processor = DocumentProcessor()
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def _split_into_chunks(text: str, chunk_size: int = 1000) -> List[str]:
-    """Split text into fixed-size chunks"""
-    return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
+def _document_progress(document: models.Document) -> Dict:
+    """Per-stage ingestion progress of a document"""
+    return {
+        "pages_extracted": document.pages_extracted or 0,
+        "chunks_total": document.chunks_total or 0,
+        "chunks_embedded": document.chunks_embedded or 0,
+        "points_stored": document.points_stored or 0,
+    }
 
-@router.post("/upload")
+async def _save_upload(file: UploadFile) -> SpooledFile:
+    """Stream the upload to disk off the event loop, hashing it and enforcing the size limit"""
+    try:
+        return await asyncio.to_thread(spool_file, file, UPLOAD_DIR, settings.UPLOAD_MAX_BYTES)
+    except FileTooLargeError as e:
+        raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, str(e))
+
+async def _find_duplicates(db: AsyncSession, user_id: int, content_hashes: Iterable[str]) -> Dict[str, models.Document]:
+    """User's documents with these content hashes; failed ones are not duplicates and may be uploaded again"""
+    content_hashes = list(set(content_hashes))
+    if not content_hashes:
+        return {}
+    documents = (await db.scalars(
+        select(models.Document)
+        .where(
+            models.Document.user_id == user_id,
+            models.Document.content_hash.in_(content_hashes),
+            models.Document.status != DocumentStatus.FAILED
+        )
+        .order_by(models.Document.id)
+    )).all()
+    duplicates: Dict[str, models.Document] = {}
+    for document in documents:
+        duplicates.setdefault(document.content_hash, document)
+    return duplicates
+
+def _discard(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+def _duplicate_response(response: Response, document: models.Document) -> Dict:
+    response.status_code = status.HTTP_200_OK
+    return {
+        "id": document.id,
+        "job_id": document.job_id,
+        "title": document.title,
+        "status": document.status,
+        "processed": document.processed,
+        "duplicate": True,
+        "message": "Identical document already uploaded",
+        "timestamp": datetime.now().isoformat()
+    }
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
+    response: Response,
     file: UploadFile = File(...), 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """
-    Upload and process a document
+    Upload a document and queue it for background processing
     - Text extraction
     - Chunk splitting
     - Embedding generation
     - Storage in Qdrant
+    Progress is reported by /documents/{id}/status
+    Re-uploading identical content returns the existing document (200) without reprocessing it
     """
     try:
         # Check file type
         if not file.filename:
             raise HTTPException(400, "File must have a name")
         
-        # Generate unique filename to avoid collisions
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4().hex}{file_extension}"
-        file_location = os.path.join(UPLOAD_DIR, unique_filename)
-        
         # Save file temporarily
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Extract text from document
-        text = await document_processor.extract_text(file_location, file.content_type)
-        if not text:
-            # Clean up temporary file
-            os.remove(file_location)
-            raise HTTPException(400, "Could not extract text from document")
+        upload = await _save_upload(file)
+        file_location = upload.path
 
-        # Split text into chunks
-        chunks = _split_into_chunks(text)
+        duplicate = (await _find_duplicates(db, current_user.id, [upload.content_hash])).get(upload.content_hash)
+        if duplicate is not None:
+            _discard(file_location)
+            return _duplicate_response(response, duplicate)
 
         # Save metadata in database with user_id
+        job_id = uuid.uuid4().hex
         db_document = models.Document(
             title=file.filename,
             source=file_location,
-            content=text,
             file_type=file.content_type,
-            file_size=os.path.getsize(file_location),
-            processed=False,
+            file_size=upload.size,
+            content_hash=upload.content_hash,
+            status=DocumentStatus.PENDING,
+            job_id=job_id,
             user_id=current_user.id
         )
         db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
-
-        # Generate and store embeddings
-        success = await embedding_service.store_embeddings(
-            document_id=db_document.id,
-            chunks=chunks,
-            metadata={
-                "filename": file.filename,
-                "content_type": file.content_type,
-                "original_filename": file.filename,
-                "user_id": current_user.id
+        try:
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            _discard(file_location)
+            if not isinstance(e, IntegrityError):
+                raise
+            # A concurrent upload of the same content was registered first
+            duplicate = (await _find_duplicates(db, current_user.id, [upload.content_hash])).get(upload.content_hash)
+            if duplicate is None:
+                raise
+            return _duplicate_response(response, duplicate)
+        await db.refresh(db_document)
+        document_metadata_cache.invalidate(db_document.id)
+        await invalidate_user(current_user.id)
+
+        # Hand the heavy lifting over to the ingestion workers
+        await ingestion_queue.enqueue(
+            IngestionJob(
+                job_id=job_id,
+                document_id=db_document.id,
+                file_path=file_location,
+                filename=file.filename,
+                content_type=file.content_type,
+                user_id=current_user.id,
+            )
+        )
+
+        return {
+            "id": db_document.id,
+            "job_id": job_id,
+            "title": file.filename,
+            "status": db_document.status,
+            "processed": False,
+            "duplicate": False,
+            "message": "Document queued for processing",
+            "timestamp": datetime.now().isoformat()
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(500, f"Internal server error: {str(e)}")
+
+# Keeps bulk ingestion tasks alive after their client disconnects
+_bulk_producers: Set[asyncio.Task] = set()
+
+# The bulk endpoint parses its own form, so its body is documented here
+BULK_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                }
             }
+        },
+    }
+}
+
+def _spool_entries(file: UploadFile, max_entries: int) -> Iterator[Union[SpooledFile, Dict]]:
+    """Spooled documents of one uploaded file or archive (dicts for skipped entries); blocking"""
+    if not file.filename:
+        raise ValueError("File must have a name")
+    if max_entries <= 0:
+        raise ValueError("Too many files in this upload")
+    if is_archive(file):
+        yield from iter_archive(file, UPLOAD_DIR, settings.BULK_MAX_FILE_BYTES, max_entries)
+    elif not document_processor.supports(file.content_type):
+        # Same filter as archive entries: never spooled, registered or queued
+        yield {"filename": file.filename, "error": "Unsupported file type"}
+    else:
+        yield spool_file(file, UPLOAD_DIR, settings.BULK_MAX_FILE_BYTES)
+
+async def _register_bulk_entry(db: AsyncSession, entry: SpooledFile, user_id: int) -> Union[models.Document, Dict]:
+    """Register one spooled document, or return the duplicate/skipped event replacing it (and discard the file)"""
+    try:
+        duplicate = (await _find_duplicates(db, user_id, [entry.content_hash])).get(entry.content_hash)
+        if duplicate is None:
+            document = models.Document(
+                title=entry.filename,
+                source=entry.path,
+                file_type=entry.content_type,
+                file_size=entry.size,
+                content_hash=entry.content_hash,
+                status=DocumentStatus.PENDING,
+                job_id=uuid.uuid4().hex,
+                user_id=user_id
+            )
+            db.add(document)
+            try:
+                await db.commit()
+                return document
+            except IntegrityError:
+                await db.rollback()
+                # A concurrent upload of the same content was registered first
+                duplicate = (await _find_duplicates(db, user_id, [entry.content_hash])).get(entry.content_hash)
+                if duplicate is None:
+                    raise
+    except Exception as e:
+        await db.rollback()
+        _discard(entry.path)
+        return {"event": "skipped", "filename": entry.filename, "error": str(e)}
+
+    _discard(entry.path)
+    return {"event": "duplicate", "filename": entry.filename, "document_id": duplicate.id}
+
+async def _ingest_bulk(form: FormData, files: List[UploadFile], user_id: int, events: asyncio.Queue):
+    """
+    Spool, register and enqueue one document at a time.
+
+    Each document is queued as soon as it is on disk, and enqueue() waits
+    while the bounded ingestion queue is full, so spooling never runs more
+    than a queue's worth of documents ahead of the workers. Skipped and
+    duplicate entries are reported on events, followed by the number of
+    registered documents; the workers add each document's outcome.
+    """
+    registered = 0
+    spooled = 0
+    db = SessionLocal()
+    try:
+        for file in files:
+            entries = _spool_entries(file, settings.BULK_MAX_FILES - spooled)
+            while True:
+                try:
+                    entry = await asyncio.to_thread(next, entries, None)
+                except Exception as e:
+                    events.put_nowait({"event": "skipped", "filename": file.filename, "error": str(e)})
+                    break
+                if entry is None:
+                    break
+                if isinstance(entry, dict):
+                    events.put_nowait({"event": "skipped", **entry})
+                    continue
+
+                spooled += 1
+                result = await _register_bulk_entry(db, entry, user_id)
+                if isinstance(result, dict):
+                    events.put_nowait(result)
+                    continue
+
+                document_metadata_cache.invalidate(result.id)
+                await invalidate_user(user_id)
+                await ingestion_queue.enqueue(
+                    IngestionJob(
+                        job_id=result.job_id,
+                        document_id=result.id,
+                        file_path=result.source,
+                        filename=result.title,
+                        content_type=result.file_type,
+                        user_id=user_id,
+                        results=events,
+                    )
+                )
+                registered += 1
+    finally:
+        events.put_nowait({"event": "registered", "documents": registered})
+        await db.close()
+        await form.close()
+
+@router.post("/upload/bulk", status_code=status.HTTP_202_ACCEPTED, openapi_extra=BULK_UPLOAD_OPENAPI)
+async def upload_documents_bulk(
+    request: Request,
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Upload many files and/or ZIP archives (form field "files") in one request
+    - Files and archive entries are streamed to disk one at a time
+    - Each document is queued as soon as it is written; the bounded ingestion
+      queue paces the spooling of the rest (back-pressure)
+    - Content already uploaded (or repeated in the batch) is reported as duplicate, not ingested
+    - Progress is streamed back as NDJSON while the batch is processed: one line
+      per skipped, duplicate or finished document, then a summary with
+      throughput and per-file failures
+    """
+    started = time.time()
+
+    # Parsed here rather than through File(...): FastAPI closes its own form before a
+    # streaming response starts, and the files are spooled while the response streams
+    form = await request.form(max_files=settings.BULK_MAX_FILES)
+    files = [value for value in form.getlist("files") if isinstance(value, StarletteUploadFile)]
+    if not files:
+        await form.close()
+        raise HTTPException(400, "No files to upload")
+
+    events: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.create_task(_ingest_bulk(form, files, current_user.id, events))
+    _bulk_producers.add(producer)
+    producer.add_done_callback(_bulk_producers.discard)
+
+    async def progress():
+        failures = []
+        documents = None
+        finished = 0
+        ready = 0
+        chunks = 0
+        skipped = 0
+        duplicates = 0
+        while documents is None or finished < documents:
+            event = await events.get()
+            if event.get("event") == "registered":
+                documents = event["documents"]
+                continue
+
+            if event.get("event") == "skipped":
+                skipped += 1
+                failures.append({"filename": event["filename"], "error": event["error"]})
+            elif event.get("event") == "duplicate":
+                duplicates += 1
+            else:
+                finished += 1
+                if event["status"] == DocumentStatus.READY:
+                    ready += 1
+                    chunks += event["chunks"]
+                else:
+                    failures.append({
+                        "filename": event["filename"],
+                        "document_id": event["document_id"],
+                        "error": event["error"],
+                    })
+                event = {"event": event["status"], **event}
+            yield json.dumps(event) + "\n"
+
+        elapsed = time.time() - started
+        yield json.dumps({
+            "event": "summary",
+            "documents": documents,
+            "ready": ready,
+            "failed": documents - ready,
+            "skipped": skipped,
+            "duplicates": duplicates,
+            "chunks": chunks,
+            "elapsed_seconds": round(elapsed, 3),
+            "docs_per_second": round(ready / elapsed, 3) if elapsed else 0.0,
+            "chunks_per_second": round(chunks / elapsed, 3) if elapsed else 0.0,
+            "failures": failures,
+            "timestamp": datetime.now().isoformat()
+        }) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson", status_code=status.HTTP_202_ACCEPTED)
+
+@router.put("/documents/{document_id}", status_code=status.HTTP_202_ACCEPTED)
+async def reingest_document(
+    document_id: int,
+    response: Response,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Replace the file of a document and re-ingest it incrementally
+    - Unchanged chunks keep their vectors
+    - Only new chunks are embedded
+    - Chunks missing from the new file are deleted from Qdrant
+    An identical file leaves a ready document untouched (200)
+    """
+    try:
+        if not file.filename:
+            raise HTTPException(400, "File must have a name")
+
+        document = await db.scalar(
+            select(models.Document).where(
+                models.Document.id == document_id,
+                models.Document.user_id == current_user.id
+            )
         )
+        if not document:
+            raise HTTPException(404, "Document not found or access not authorized")
+        if document.status not in (DocumentStatus.READY, DocumentStatus.FAILED):
+            raise HTTPException(409, "Document is still being processed")
+
+        upload = await _save_upload(file)
+        file_location = upload.path
+        if document.status == DocumentStatus.READY and upload.content_hash == document.content_hash:
+            _discard(file_location)
+            response.status_code = status.HTTP_200_OK
+            return {
+                "id": document_id,
+                "job_id": document.job_id,
+                "title": document.title,
+                "status": document.status,
+                "processed": True,
+                "message": "Document content unchanged",
+                "timestamp": datetime.now().isoformat()
+            }
+        previous_source = document.source
 
-        # Update document status
-        db_document.processed = success
-        db.commit()
+        job_id = uuid.uuid4().hex
+        document.transition_to(DocumentStatus.PENDING)
+        document.title = file.filename
+        document.source = file_location
+        document.file_type = file.content_type
+        document.file_size = upload.size
+        document.content_hash = upload.content_hash
+        document.job_id = job_id
+        document.error_message = None
+        try:
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            _discard(file_location)
+            if isinstance(e, IntegrityError):
+                raise HTTPException(409, "Identical content already belongs to another document")
+            raise
 
-        # Consistent logs with result
-        if not success:
-            message = "Document processed but no chunks stored"
-        else:
-            message = "Document processed and stored successfully"
+        document_metadata_cache.invalidate(document_id)
+        await invalidate_user(current_user.id)
 
-        # Prepare response
-        response_data = {
-            "id": db_document.id,
+        await ingestion_queue.enqueue(
+            IngestionJob(
+                job_id=job_id,
+                document_id=document_id,
+                file_path=file_location,
+                filename=file.filename,
+                content_type=file.content_type,
+                user_id=current_user.id,
+                previous_source=previous_source,
+            )
+        )
+
+        return {
+            "id": document_id,
+            "job_id": job_id,
             "title": file.filename,
-            "chunks_created": len(chunks),
-            "message": message,
-            "processed": success,
+            "status": document.status,
+            "processed": False,
+            "message": "Document queued for re-ingestion",
             "timestamp": datetime.now().isoformat()
         }
 
-        return response_data
-
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(500, f"Internal server error: {str(e)}")
 
 @router.get("/documents/{document_id}/status")
 async def get_document_status(
     document_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    qdrant_client: AsyncQdrantClient = Depends(get_qdrant_client),
     current_user: models.User = Depends(get_current_user)
 ):
     """
@@ -124,10 +477,12 @@ async def get_document_status(
     """
     try:
         # Check that document belongs to user
-        document = db.query(models.Document).filter(
-            models.Document.id == document_id,
-            models.Document.user_id == current_user.id
-        ).first()
+        document = await db.scalar(
+            select(models.Document).where(
+                models.Document.id == document_id,
+                models.Document.user_id == current_user.id
+            )
+        )
         
         if not document:
             raise HTTPException(404, "Document not found")
@@ -135,8 +490,8 @@ async def get_document_status(
         # Count chunks in Qdrant for this document
         try:
             from qdrant_client.models import Filter, FieldCondition, MatchValue
-            chunks_count = embedding_service.qdrant_client.count(
-                collection_name="documents",
+            chunks_count = await qdrant_client.count(
+                collection_name=embedding_service.collection_name,
                 count_filter=Filter(
                     must=[
                         FieldCondition(key="document_id", match=MatchValue(value=document_id)),
@@ -151,7 +506,11 @@ async def get_document_status(
         return {
             "id": document.id,
             "title": document.title,
+            "job_id": document.job_id,
+            "status": document.status,
             "processed": document.processed,
+            "progress": _document_progress(document),
+            "error": document.error_message,
             "file_size": document.file_size,
             "file_type": document.file_type,
             "chunks_stored": chunks_stored,
@@ -164,9 +523,13 @@ async def get_document_status(
     except Exception as e:
         raise HTTPException(500, f"Internal server error: {str(e)}")
 
+def _document_list_cache_key(skip, limit, current_user, **_):
+    return current_user.id, (skip, limit)
+
 @router.get("/documents")
+@cache_response("documents", _document_list_cache_key, ttl=settings.DOCUMENT_LIST_CACHE_TTL)
 async def list_documents(
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_db), 
     skip: int = 0, 
     limit: int = 10,
     current_user: models.User = Depends(get_current_user)
@@ -176,13 +539,19 @@ async def list_documents(
     """
     try:
         # Filter only user's documents
-        documents = db.query(models.Document).filter(
-            models.Document.user_id == current_user.id
-        ).order_by(models.Document.uploaded_at.desc()).offset(skip).limit(limit).all()
+        documents = (await db.scalars(
+            select(models.Document)
+            .where(models.Document.user_id == current_user.id)
+            .order_by(models.Document.uploaded_at.desc())
+            .offset(skip)
+            .limit(limit)
+        )).all()
         
-        total_count = db.query(models.Document).filter(
-            models.Document.user_id == current_user.id
-        ).count()
+        total_count = await db.scalar(
+            select(func.count()).select_from(models.Document).where(
+                models.Document.user_id == current_user.id
+            )
+        )
         
         documents_list = []
         for doc in documents:
@@ -191,6 +560,7 @@ async def list_documents(
                 "title": doc.title,
                 "file_size": doc.file_size,
                 "file_type": doc.file_type,
+                "status": doc.status,
                 "processed": doc.processed,
                 "uploaded_at": doc.uploaded_at.isoformat() if doc.uploaded_at else None
             })
@@ -209,7 +579,8 @@ async def list_documents(
 @router.delete("/documents/{document_id}")
 async def delete_document(
     document_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    qdrant_client: AsyncQdrantClient = Depends(get_qdrant_client),
     current_user: models.User = Depends(get_current_user)
 ):
     """
@@ -217,10 +588,12 @@ async def delete_document(
     """
     try:
         # Check that document belongs to user
-        document = db.query(models.Document).filter(
-            models.Document.id == document_id,
-            models.Document.user_id == current_user.id
-        ).first()
+        document = await db.scalar(
+            select(models.Document).where(
+                models.Document.id == document_id,
+                models.Document.user_id == current_user.id
+            )
+        )
         
         if not document:
             raise HTTPException(404, "Document not found or access not authorized")
@@ -228,8 +601,8 @@ async def delete_document(
         # Delete chunks from Qdrant
         try:
             from qdrant_client.models import Filter, FieldCondition, MatchValue
-            embedding_service.qdrant_client.delete(
-                collection_name="documents",
+            await qdrant_client.delete(
+                collection_name=embedding_service.collection_name,
                 points_selector=Filter(
                     must=[
                         FieldCondition(key="document_id", match=MatchValue(value=document_id)),
@@ -245,8 +618,12 @@ async def delete_document(
             os.remove(document.source)
         
         # Delete database entry
-        db.delete(document)
-        db.commit()
+        await db.delete(document)
+        await db.commit()
+        document_metadata_cache.invalidate(document_id)
+        
+        # Cached answers and responses may cite the deleted document
+        await invalidate_user(current_user.id)
         
         return {
             "message": f"Document {document_id} deleted successfully",
@@ -257,5 +634,5 @@ async def delete_document(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(500, f"Error during deletion: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,154 @@
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from app.services.embedding_cache import VECTOR_DTYPE, pack_vector
+from app.services.redis_service import RedisService, redis_service, user_namespace
+
+ENTRY_ID_LENGTH = 32
+
+
+class AnswerCache:
+    """
+    Per-user semantic cache of /chat/ask answers.
+
+    Entries live in a namespace built from (user, document-set version,
+    response style, max results, retrieval options). A lookup compares the query embedding with
+    the cached query embeddings of that namespace and returns the closest
+    answer above the similarity threshold. Uploads and deletes bump the
+    user's document-set version, which orphans every older namespace; the
+    orphans simply expire through their TTL.
+    """
+
+    def __init__(
+        self,
+        redis: RedisService,
+        enabled: bool = settings.ANSWER_CACHE_ENABLED,
+        similarity_threshold: float = settings.ANSWER_CACHE_SIMILARITY,
+        ttl: int = settings.ANSWER_CACHE_TTL,
+        max_entries: int = settings.ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        self.redis = redis
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def _namespace(
+        self,
+        user_id: int,
+        version: int,
+        response_style: str,
+        max_results: int,
+        search_mode: Optional[str] = None,
+        use_mmr: Optional[bool] = None,
+        mmr_lambda: Optional[float] = None,
+    ) -> str:
+        """Every parameter that changes the retrieved context is part of the namespace, defaults resolved"""
+        search_mode = (search_mode or settings.RETRIEVAL_SEARCH_MODE).lower()
+        use_mmr = settings.MMR_ENABLED if use_mmr is None else use_mmr
+        diversity = f"mmr{settings.MMR_LAMBDA if mmr_lambda is None else mmr_lambda:g}" if use_mmr else "nommr"
+        return f"rag:answers:{user_id}:v{version}:{response_style}:{max_results}:{search_mode}:{diversity}"
+
+    async def get_version(self, user_id: int) -> int:
+        return await self.redis.get_generation(user_namespace(user_id))
+
+    async def bump_version(self, user_id: int) -> Optional[int]:
+        """Invalidate every cached answer of a user"""
+        return await self.redis.bump_generation(user_namespace(user_id))
+
+    async def lookup(
+        self,
+        user_id: int,
+        query_embedding: List[float],
+        response_style: str,
+        max_results: int,
+        search_mode: Optional[str] = None,
+        use_mmr: Optional[bool] = None,
+        mmr_lambda: Optional[float] = None,
+    ) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Closest cached answer, and the namespace a freshly computed answer must be stored in.
+
+        The namespace pins the document-set version seen before retrieval, so an
+        answer generated while an upload or delete bumps the version is stored
+        under the old version (already orphaned) rather than served as current.
+        """
+        if not self.enabled or not self.redis.is_connected() or query_embedding is None:
+            return None, None
+
+        try:
+            namespace = self._namespace(
+                user_id, await self.get_version(user_id), response_style, max_results,
+                search_mode, use_mmr, mmr_lambda,
+            )
+        except Exception:
+            return None, None
+        return await self._find(namespace, query_embedding), namespace
+
+    async def _find(self, namespace: str, query_embedding: List[float]) -> Optional[Dict]:
+        try:
+            entries = await self.redis.range_bytes(f"{namespace}:index")
+            if not entries:
+                self.misses += 1
+                return None
+
+            entry_ids = [entry[:ENTRY_ID_LENGTH].decode("ascii") for entry in entries]
+            matrix = np.frombuffer(b"".join(entry[ENTRY_ID_LENGTH:] for entry in entries), dtype=VECTOR_DTYPE)
+            matrix = matrix.reshape(len(entries), -1)
+
+            query = np.asarray(query_embedding, dtype=VECTOR_DTYPE)
+            norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+            similarities = (matrix @ query) / np.where(norms == 0, 1.0, norms)
+
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            cached = await self.redis.get(f"{namespace}:entry:{entry_ids[best]}")
+            if cached is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            cached["cache_similarity"] = round(float(similarities[best]), 4)
+            return cached
+
+        except Exception:
+            return None
+
+    async def store(self, namespace: Optional[str], query_embedding: List[float], payload: Dict) -> bool:
+        """Store an answer in the namespace returned by the lookup that preceded it"""
+        if not self.enabled or not self.redis.is_connected() or namespace is None or query_embedding is None:
+            return False
+
+        try:
+            entry_id = uuid.uuid4().hex
+            if not await self.redis.set(f"{namespace}:entry:{entry_id}", payload, self.ttl):
+                return False
+            return await self.redis.push_bytes(
+                f"{namespace}:index",
+                entry_id.encode("ascii") + pack_vector(query_embedding),
+                self.max_entries,
+                self.ttl,
+            )
+
+        except Exception:
+            return False
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+answer_cache = AnswerCache(redis_service)
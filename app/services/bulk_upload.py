@@ -0,0 +1,106 @@
+import hashlib
+import mimetypes
+import os
+import uuid
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+from fastapi import UploadFile
+
+from app.services.job_queue import document_processor
+
+ARCHIVE_TYPES = ("application/zip", "application/x-zip-compressed")
+# Copies go through a fixed-size buffer, never through a whole file or archive in memory
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+@dataclass
+class SpooledFile:
+    """A document written to the upload directory, ready to be registered and queued"""
+    filename: str
+    path: str
+    size: int
+    content_type: Optional[str]
+    content_hash: str
+
+
+class FileTooLargeError(ValueError):
+    pass
+
+
+def is_archive(file: UploadFile) -> bool:
+    return file.content_type in ARCHIVE_TYPES or (file.filename or "").lower().endswith(".zip")
+
+
+def write_stream(source: BinaryIO, upload_dir: str, filename: str, max_bytes: int) -> Tuple[str, int, str]:
+    """
+    Stream source into a uniquely named file in fixed-size blocks.
+
+    The SHA-256 is computed during the same pass and max_bytes is enforced
+    while writing; a partial file is removed on failure. Blocking: run it in
+    a thread. Returns (path, size, sha256 hex digest).
+    """
+    path = os.path.join(upload_dir, f"{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as destination:
+            while True:
+                block = source.read(COPY_BUFFER_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise FileTooLargeError(f"File exceeds {max_bytes} bytes")
+                digest.update(block)
+                destination.write(block)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+def spool_file(file: UploadFile, upload_dir: str, max_bytes: int) -> SpooledFile:
+    path, size, content_hash = write_stream(file.file, upload_dir, file.filename, max_bytes)
+    return SpooledFile(file.filename, path, size, file.content_type, content_hash)
+
+
+def iter_archive(file: UploadFile, upload_dir: str, max_bytes: int, max_entries: int) -> Iterator[Union[SpooledFile, Dict]]:
+    """
+    Write the supported entries of a ZIP upload to disk one at a time.
+
+    The archive is read in place from the spooled upload; only its central
+    directory and one copy buffer are held in memory. Yields each spooled
+    entry as soon as it is on disk, or a dict with the reason it was skipped.
+    Blocking: advance it in a thread.
+    """
+    spooled = 0
+    with zipfile.ZipFile(file.file) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            basename = os.path.basename(name.rstrip("/"))
+            if info.is_dir() or name.startswith("__MACOSX/") or basename.startswith("."):
+                continue
+
+            content_type = mimetypes.guess_type(basename)[0]
+            if not document_processor.supports(content_type):
+                yield {"filename": name, "error": "Unsupported file type"}
+                continue
+            if info.file_size > max_bytes:
+                yield {"filename": name, "error": f"File exceeds {max_bytes} bytes"}
+                continue
+            if spooled >= max_entries:
+                yield {"filename": name, "error": "Too many files in this upload"}
+                continue
+
+            try:
+                # The declared size is re-checked while copying (archives can lie about it)
+                with archive.open(info) as source:
+                    path, size, content_hash = write_stream(source, upload_dir, basename, max_bytes)
+            except Exception as e:
+                yield {"filename": name, "error": str(e)}
+                continue
+            spooled += 1
+            yield SpooledFile(name, path, size, content_type, content_hash)
@@ -0,0 +1,288 @@
+import math
+import re
+import zlib
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Type
+
+from app.services.tokenizer import count_tokens
+
+# Sentence ends (optionally followed by closing quotes/brackets) or blank lines
+BOUNDARY_RE = re.compile(r'(?<=[.!?])["\')\]]*\s+|\n\s*\n')
+PARAGRAPH_RE = re.compile(r'\n\s*\n')
+WORD_RE = re.compile(r'\S+')
+
+
+@dataclass
+class Chunk:
+    text: str
+    index: int
+    start_offset: int
+    end_offset: int
+    page_number: Optional[int] = None
+    page_end: Optional[int] = None
+    token_count: int = 0
+
+
+@dataclass
+class _Unit:
+    text: str
+    start: int
+    end: int
+    tokens: int
+    paragraph_start: bool
+
+
+class BaseChunker:
+    """
+    Streaming chunker interface.
+
+    Pages are fed in document order with feed(); finished chunks are returned
+    as soon as they are complete and flush() returns whatever is left.
+    Offsets refer to the document text with pages joined by "\\n".
+    """
+
+    def __init__(self):
+        self._next_index = 0
+        self._next_offset = 0
+        self._page_starts: List[int] = []
+        self._page_numbers: List[Optional[int]] = []
+
+    def feed(self, text: str, page_number: Optional[int] = None) -> List[Chunk]:
+        raise NotImplementedError
+
+    def flush(self) -> List[Chunk]:
+        raise NotImplementedError
+
+    def chunk_text(self, text: str) -> List[Chunk]:
+        """Chunk a whole text in one call"""
+        return self.feed(text) + self.flush()
+
+    def _register_page(self, text: str, page_number: Optional[int]) -> int:
+        page_start = self._next_offset
+        self._page_starts.append(page_start)
+        self._page_numbers.append(page_number)
+        self._next_offset = page_start + len(text) + 1
+        return page_start
+
+    def _page_at(self, offset: int) -> Optional[int]:
+        position = bisect_right(self._page_starts, offset) - 1
+        return self._page_numbers[max(position, 0)] if self._page_numbers else None
+
+    def _make_chunk(self, text: str, start: int, end: int, tokens: Optional[int] = None) -> Chunk:
+        chunk = Chunk(
+            text=text,
+            index=self._next_index,
+            start_offset=start,
+            end_offset=end,
+            page_number=self._page_at(start),
+            page_end=self._page_at(max(start, end - 1)),
+            token_count=tokens if tokens is not None else count_tokens(text),
+        )
+        self._next_index += 1
+        return chunk
+
+
+class FixedSizeChunker(BaseChunker):
+    """Legacy fixed-size character chunker"""
+
+    def __init__(self, chunk_size: int = 1000, **_):
+        super().__init__()
+        self.chunk_size = chunk_size
+        self._buffer = ""
+        self._buffer_start = 0
+
+    def feed(self, text: str, page_number: Optional[int] = None) -> List[Chunk]:
+        page_start = self._register_page(text, page_number)
+        if not self._buffer:
+            self._buffer_start = page_start
+        self._buffer += text + "\n"
+
+        full = len(self._buffer) // self.chunk_size * self.chunk_size
+        chunks = [
+            self._make_chunk(
+                self._buffer[i:i + self.chunk_size],
+                self._buffer_start + i,
+                self._buffer_start + i + self.chunk_size,
+            )
+            for i in range(0, full, self.chunk_size)
+        ]
+        self._buffer = self._buffer[full:]
+        self._buffer_start += full
+        return chunks
+
+    def flush(self) -> List[Chunk]:
+        remainder, self._buffer = self._buffer, ""
+        if not remainder.strip():
+            return []
+        return [self._make_chunk(remainder, self._buffer_start, self._buffer_start + len(remainder))]
+
+
+class SentenceChunker(BaseChunker):
+    """
+    Token-budgeted chunker that only cuts on sentence and paragraph boundaries.
+
+    Sentences are packed greedily up to max_tokens; the trailing sentences of a
+    chunk (up to overlap_tokens) are repeated at the start of the next one.
+    Sentences longer than the budget are split on word boundaries.
+
+    With anchor_interval > 0, about one sentence in anchor_interval (picked by
+    a checksum of its own text) always starts a new chunk. Boundaries then
+    re-synchronise shortly after an edit, so re-ingesting an edited document
+    only produces a few new chunks.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 300,
+        overlap_tokens: int = 40,
+        model: Optional[str] = None,
+        anchor_interval: int = 0,
+        **_,
+    ):
+        super().__init__()
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.model = model
+        self.anchor_interval = max(0, anchor_interval)
+        # Text without a sentence boundary is force-split past this size
+        self._max_pending_chars = self.max_tokens * 16
+        self._pending = ""
+        self._pending_start = 0
+        self._pending_paragraph = True
+        self._current: List[_Unit] = []
+        self._current_tokens = 0
+
+    def feed(self, text: str, page_number: Optional[int] = None) -> List[Chunk]:
+        page_start = self._register_page(text, page_number)
+        if self._pending:
+            self._pending += "\n"
+        else:
+            self._pending_start = page_start
+        self._pending += text
+
+        return self._pack(self._split_units(final=False))
+
+    def flush(self) -> List[Chunk]:
+        chunks = self._pack(self._split_units(final=True))
+        if self._current:
+            chunks.append(self._emit())
+        self._current = []
+        self._current_tokens = 0
+        return chunks
+
+    def _split_units(self, final: bool) -> List[_Unit]:
+        """Cut complete sentences off the pending text"""
+        units = []
+        text = self._pending
+        cursor = 0
+        paragraph_start = self._pending_paragraph
+
+        for match in BOUNDARY_RE.finditer(text):
+            units.extend(self._make_units(text, cursor, match.start(), paragraph_start))
+            paragraph_start = bool(PARAGRAPH_RE.search(match.group()))
+            cursor = match.end()
+
+        tail_end = len(text)
+        if not final and tail_end - cursor > self._max_pending_chars:
+            # No boundary for a long stretch: cut at the last whitespace
+            last_space = text.rfind(" ", cursor, tail_end)
+            if last_space > cursor:
+                units.extend(self._make_units(text, cursor, last_space, paragraph_start))
+                paragraph_start = False
+                cursor = last_space + 1
+
+        if final:
+            units.extend(self._make_units(text, cursor, tail_end, paragraph_start))
+            cursor = tail_end
+            paragraph_start = True
+
+        self._pending = text[cursor:]
+        self._pending_start += cursor
+        self._pending_paragraph = paragraph_start
+        return units
+
+    def _make_units(self, text: str, start: int, end: int, paragraph_start: bool) -> List[_Unit]:
+        segment = text[start:end]
+        stripped = segment.strip()
+        if not stripped:
+            return []
+
+        start += len(segment) - len(segment.lstrip())
+        end = start + len(stripped)
+        base = self._pending_start
+        tokens = count_tokens(stripped, self.model)
+        if tokens <= self.max_tokens:
+            return [_Unit(stripped, base + start, base + end, tokens, paragraph_start)]
+
+        # Oversized sentence: split its words into evenly sized windows
+        words = [(m.start() + start, m.end() + start) for m in WORD_RE.finditer(stripped)]
+        pieces = math.ceil(tokens / self.max_tokens)
+        per_piece = max(1, math.ceil(len(words) / pieces))
+        units = []
+        for i in range(0, len(words), per_piece):
+            window = words[i:i + per_piece]
+            piece_start, piece_end = window[0][0], window[-1][1]
+            piece_text = text[piece_start:piece_end]
+            piece_tokens = count_tokens(piece_text, self.model)
+            if piece_tokens > self.max_tokens and len(window) > 1:
+                units.extend(self._make_units(text, piece_start, piece_end, paragraph_start and i == 0))
+                continue
+            units.append(_Unit(piece_text, base + piece_start, base + piece_end, piece_tokens, paragraph_start and i == 0))
+        return units
+
+    def _is_anchor(self, unit: _Unit) -> bool:
+        """Content-defined boundary: depends only on the sentence itself, never on what precedes it"""
+        return self.anchor_interval > 0 and zlib.crc32(unit.text.encode("utf-8")) % self.anchor_interval == 0
+
+    def _pack(self, units: List[_Unit]) -> List[Chunk]:
+        chunks = []
+        for unit in units:
+            if self._current and (self._current_tokens + unit.tokens > self.max_tokens or self._is_anchor(unit)):
+                chunks.append(self._emit())
+                self._carry_overlap(unit.tokens)
+            self._current.append(unit)
+            self._current_tokens += unit.tokens
+        return chunks
+
+    def _emit(self) -> Chunk:
+        parts = [self._current[0].text]
+        for unit in self._current[1:]:
+            parts.append("\n\n" if unit.paragraph_start else " ")
+            parts.append(unit.text)
+        return self._make_chunk(
+            "".join(parts),
+            self._current[0].start,
+            self._current[-1].end,
+            tokens=self._current_tokens,
+        )
+
+    def _carry_overlap(self, next_tokens: int):
+        """Keep trailing sentences of the emitted chunk as overlap for the next one"""
+        carried: List[_Unit] = []
+        carried_tokens = 0
+        for unit in reversed(self._current):
+            if carried_tokens + unit.tokens > self.overlap_tokens:
+                break
+            carried.insert(0, unit)
+            carried_tokens += unit.tokens
+
+        if carried_tokens + next_tokens > self.max_tokens:
+            carried, carried_tokens = [], 0
+
+        self._current = carried
+        self._current_tokens = carried_tokens
+
+
+CHUNKERS: Dict[str, Type[BaseChunker]] = {
+    "fixed": FixedSizeChunker,
+    "sentence": SentenceChunker,
+}
+
+
+def get_chunker(name: str = "sentence", **options) -> BaseChunker:
+    """Build a fresh chunker instance by name"""
+    try:
+        return CHUNKERS[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown chunker '{name}'. Available: {', '.join(CHUNKERS)}")
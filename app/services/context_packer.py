@@ -0,0 +1,117 @@
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from config import settings
+from app.services.tokenizer import count_tokens, truncate_to_tokens
+
+CONTEXT_HEADER = "## DOCUMENT CONTEXT:\n\n"
+CONTEXT_SEPARATOR = "---\n\n"
+CONTEXT_INSTRUCTIONS = (
+    "## INSTRUCTIONS:\n"
+    "Answer the question using exclusively the context above.\n"
+    "Cite your sources with format: [Filename]\n"
+    "If information is not in context, say so clearly."
+)
+EMPTY_CONTEXT = "No relevant context found in documents."
+TRUNCATION_MARKER = " [...]"
+# Slack per chunk for the "\n\n" after its text and BPE merges across part boundaries
+BOUNDARY_SLACK_TOKENS = 3
+
+
+@dataclass
+class PackedContext:
+    text: str
+    chunks: List[Dict] = field(default_factory=list)
+    tokens: int = 0
+    budget: int = 0
+    dropped: int = 0
+    truncated: int = 0
+
+    def get_stats(self) -> Dict:
+        return {
+            "context_tokens": self.tokens,
+            "context_budget": self.budget,
+            "chunks_used": len(self.chunks),
+            "chunks_dropped": self.dropped,
+            "chunks_truncated": self.truncated,
+        }
+
+
+class ContextPacker:
+    """
+    Packs retrieved chunks into the LLM prompt under a token budget.
+
+    The budget is the model's context window minus the tokens reserved for
+    the rest of the prompt and the completion, capped at max_context_tokens.
+    Chunks are added in the order given (retrieval rank, or the MMR selection
+    order) and counted with the chat model's tokenizer; one that does not fit
+    is trimmed to the remaining room, or dropped when that room is below
+    min_chunk_tokens.
+    """
+
+    def __init__(
+        self,
+        model: str = settings.LLM_MODEL,
+        context_window: int = settings.LLM_CONTEXT_WINDOW,
+        max_context_tokens: int = settings.CONTEXT_MAX_TOKENS,
+        min_chunk_tokens: int = settings.CONTEXT_MIN_CHUNK_TOKENS,
+    ):
+        self.model = model
+        self.context_window = context_window
+        self.max_context_tokens = max_context_tokens
+        self.min_chunk_tokens = max(1, min_chunk_tokens)
+
+    def budget(self, reserved_tokens: int = 0) -> int:
+        """Tokens available for the document context"""
+        available = self.context_window - reserved_tokens
+        if self.max_context_tokens > 0:
+            available = min(available, self.max_context_tokens)
+        return max(0, available)
+
+    def pack(self, contexts: List[Dict], reserved_tokens: int = 0) -> PackedContext:
+        budget = self.budget(reserved_tokens)
+        if not contexts:
+            return PackedContext(text=EMPTY_CONTEXT, tokens=count_tokens(EMPTY_CONTEXT, self.model), budget=budget)
+
+        frame_tokens = count_tokens(CONTEXT_HEADER + CONTEXT_INSTRUCTIONS, self.model)
+        separator_tokens = count_tokens(CONTEXT_SEPARATOR, self.model)
+        remaining = budget - frame_tokens
+
+        parts = [CONTEXT_HEADER]
+        packed = PackedContext(text="", budget=budget)
+        for context in contexts:
+            position = len(packed.chunks) + 1
+            heading = f"### Document {position}: {context['title']} (Relevance score: {context['score']:.3f})\n"
+            overhead = count_tokens(heading, self.model) + separator_tokens + BOUNDARY_SLACK_TOKENS
+            text = context["text"]
+            # The payload token_count was measured with the embedding model's tokenizer
+            text_tokens = count_tokens(text, self.model)
+
+            room = remaining - overhead
+            if text_tokens > room:
+                if room < self.min_chunk_tokens:
+                    packed.dropped += 1
+                    continue
+                marker_tokens = count_tokens(TRUNCATION_MARKER, self.model)
+                text = truncate_to_tokens(text, room - marker_tokens, self.model).rstrip() + TRUNCATION_MARKER
+                text_tokens = count_tokens(text, self.model)
+                packed.truncated += 1
+
+            parts.append(heading)
+            parts.append(f"{text}\n\n")
+            parts.append(CONTEXT_SEPARATOR)
+            remaining -= overhead + text_tokens
+            packed.chunks.append(context)
+
+        if not packed.chunks:
+            packed.text = EMPTY_CONTEXT
+            packed.tokens = count_tokens(EMPTY_CONTEXT, self.model)
+            return packed
+
+        parts.append(CONTEXT_INSTRUCTIONS)
+        packed.text = "".join(parts)
+        packed.tokens = count_tokens(packed.text, self.model)
+        return packed
+
+
+context_packer = ContextPacker()
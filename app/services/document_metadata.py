@@ -0,0 +1,68 @@
+from typing import Dict, Iterable, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from app.db import models
+from app.services.local_cache import LocalLRUCache
+
+# Only the columns needed to label sources; never the document content
+METADATA_COLUMNS = (
+    models.Document.id,
+    models.Document.title,
+    models.Document.file_type,
+    models.Document.uploaded_at,
+    models.Document.source,
+)
+
+
+class DocumentMetadataCache:
+    """
+    In-process TTL cache of document metadata keyed by document id.
+
+    Misses are loaded with a single IN query. Entries are invalidated when a
+    document is uploaded or deleted; the TTL bounds staleness across workers.
+    """
+
+    def __init__(
+        self,
+        max_items: int = settings.DOCUMENT_METADATA_CACHE_ITEMS,
+        ttl: float = settings.DOCUMENT_METADATA_CACHE_TTL,
+    ):
+        self._cache = LocalLRUCache(maxsize=max_items, ttl=ttl)
+
+    async def get_many(self, db: AsyncSession, document_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Metadata for the given ids; ids without a document row are left out"""
+        metadata: Dict[int, Dict] = {}
+        missing: List[int] = []
+        for document_id in set(document_ids):
+            cached = self._cache.get(document_id)
+            if cached is not None:
+                metadata[document_id] = cached
+            else:
+                missing.append(document_id)
+
+        if missing:
+            rows = (await db.execute(select(*METADATA_COLUMNS).where(models.Document.id.in_(missing)))).all()
+            for row in rows:
+                entry = {
+                    "id": row.id,
+                    "title": row.title,
+                    "file_type": row.file_type,
+                    "uploaded_at": row.uploaded_at.isoformat() if row.uploaded_at else None,
+                    "source": row.source,
+                }
+                self._cache.set(row.id, entry)
+                metadata[row.id] = entry
+
+        return metadata
+
+    def invalidate(self, document_id: int):
+        self._cache.delete(document_id)
+
+    def get_stats(self) -> Dict:
+        return self._cache.get_stats()
+
+
+document_metadata_cache = DocumentMetadataCache()
@@ -0,0 +1,144 @@
+import hashlib
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import settings
+from app.services.local_cache import LocalLRUCache
+from app.services.redis_service import RedisService, redis_service
+
+VECTOR_DTYPE = np.dtype("<f4")
+
+
+def pack_vector(vector: List[float]) -> bytes:
+    """Pack a vector as little-endian float32 bytes"""
+    return np.asarray(vector, dtype=VECTOR_DTYPE).tobytes()
+
+
+def unpack_vector(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=VECTOR_DTYPE)
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace so trivial variations share a key"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+TRAILING_PUNCTUATION_RE = re.compile(r"[\s?!.;:,]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold and trim trailing punctuation on top of text normalization"""
+    return TRAILING_PUNCTUATION_RE.sub("", normalize_text(query).casefold())
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache.
+
+    Keys are a SHA-256 of (model, normalized text). Lookups go through an
+    in-process LRU first, then Redis where vectors are stored as packed float32.
+    """
+
+    def __init__(
+        self,
+        redis: RedisService,
+        prefix: str = "emb",
+        max_memory_items: int = settings.EMBEDDING_CACHE_MEMORY_ITEMS,
+        ttl: int = settings.EMBEDDING_CACHE_TTL,
+        memory_ttl: Optional[int] = None,
+    ):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+        self.memory = LocalLRUCache(max_memory_items, ttl=memory_ttl)
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def normalize(self, text: str) -> str:
+        return normalize_text(text)
+
+    def key_for(self, model: str, text: str) -> str:
+        digest = hashlib.sha256(f"{model}\0{self.normalize(text)}".encode("utf-8")).hexdigest()
+        return f"rag:{self.prefix}:{digest}"
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors aligned with texts (None for misses)"""
+        keys = [self.key_for(model, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        redis_lookup: Dict[str, List[int]] = {}
+        for idx, key in enumerate(keys):
+            vector = self.memory.get(key)
+            if vector is not None:
+                results[idx] = vector.tolist()
+                self.memory_hits += 1
+            else:
+                redis_lookup.setdefault(key, []).append(idx)
+
+        if redis_lookup:
+            redis_keys = list(redis_lookup)
+            values = await self.redis.get_many_bytes(redis_keys)
+            for key, value in zip(redis_keys, values):
+                if value is None:
+                    self.misses += len(redis_lookup[key])
+                    continue
+                vector = unpack_vector(value)
+                self.memory.set(key, vector)
+                for idx in redis_lookup[key]:
+                    results[idx] = vector.tolist()
+                self.redis_hits += len(redis_lookup[key])
+
+        return results
+
+    async def get(self, model: str, text: str) -> Optional[List[float]]:
+        return (await self.get_many(model, [text]))[0]
+
+    async def set(self, model: str, text: str, vector: List[float]):
+        await self.set_many(model, [text], [vector])
+
+    async def set_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        if not texts:
+            return
+        packed = {}
+        for text, vector in zip(texts, vectors):
+            key = self.key_for(model, text)
+            array = np.asarray(vector, dtype=VECTOR_DTYPE)
+            self.memory.set(key, array)
+            packed[key] = array.tobytes()
+        self.stores += len(packed)
+        await self.redis.set_many_bytes(packed, self.ttl)
+
+    def get_stats(self) -> Dict:
+        lookups = self.memory_hits + self.redis_hits + self.misses
+        hits = self.memory_hits + self.redis_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self.memory),
+            "redis_connected": self.redis.is_connected(),
+        }
+
+
+class QueryEmbeddingCache(EmbeddingCache):
+    """Query-side cache: short-lived memory tier and looser query normalization"""
+
+    def normalize(self, text: str) -> str:
+        return normalize_query(text)
+
+
+embedding_cache = EmbeddingCache(redis_service)
+query_embedding_cache = QueryEmbeddingCache(
+    redis_service,
+    prefix="qemb",
+    max_memory_items=settings.QUERY_CACHE_MEMORY_ITEMS,
+    ttl=settings.QUERY_CACHE_TTL,
+    memory_ttl=settings.QUERY_CACHE_MEMORY_TTL,
+)
@@ -1,49 +1,82 @@
 import os
 import uuid
+import hashlib
 import random
+import asyncio
 import numpy as np
 import openai
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from typing import List, Dict, Optional
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    FieldCondition,
+    Filter,
+    MatchValue,
+    PointIdsList,
+    PointStruct,
+    SetPayload,
+    SetPayloadOperation,
+)
+from typing import List, Dict, Optional, Tuple, Union
+from config import settings
+from app.services.tokenizer import count_tokens
+from app.services.chunking import Chunk
+from app.services.embedding_cache import embedding_cache, query_embedding_cache
+from app.services.vector_schema import create_collection, ensure_payload_indexes, ensure_sparse_vectors, search_params
+from app.services.sparse_encoder import SPARSE_VECTOR_NAME, sparse_encoder
+
+# Fixed namespace of chunk point ids; changing it re-embeds every document on its next ingestion
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c2b9e-4d3a-5e8f-9a7b-0c1d2e3f4a5b")
+# Payload fields that can change for an unchanged chunk (it moved, or the file was renamed)
+CHUNK_POSITION_FIELDS = (
+    "chunk_index", "start_offset", "end_offset", "page_number", "page_end", "title", "file_type",
+)
+SCROLL_PAGE_SIZE = 1000
+
+PointId = Union[int, str]
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 
 class EmbeddingService:
     def __init__(self):
         # OpenAI configuration
         self.openai_api_key = os.getenv("OPENAI_API_KEY", "").strip()
-        self.openai_client = openai.OpenAI(api_key=self.openai_api_key) if self.openai_api_key and self.openai_api_key.startswith("sk-") else None
+        self.openai_client = openai.AsyncOpenAI(api_key=self.openai_api_key) if self.openai_api_key and self.openai_api_key.startswith("sk-") else None
 
-        # Qdrant configuration
-        self.qdrant_client = QdrantClient(
-            host=os.getenv("QDRANT_HOST", "localhost"),
-            port=int(os.getenv("QDRANT_PORT", "6333")),
-            timeout=30.0,
-        )
+        # Qdrant client is shared application-wide and attached in connect()
+        self.qdrant_client: Optional[AsyncQdrantClient] = None
 
-        self.collection_name = "documents"
-        self.embedding_model = "text-embedding-3-small"
+        self.collection_name = settings.QDRANT_COLLECTION
+        self.embedding_model = settings.EMBEDDING_MODEL
         self.embedding_dimension = 1536
 
+        # Batching configuration
+        self.batch_max_tokens = settings.EMBEDDING_BATCH_MAX_TOKENS
+        self.batch_max_items = settings.EMBEDDING_BATCH_MAX_ITEMS
+        self.max_concurrency = max(1, settings.EMBEDDING_MAX_CONCURRENCY)
+
         # Determine mode
         self.use_mock_embeddings = self.openai_client is None
-        self._ensure_collection()
+        # Set once the collection is known to have the BM25 sparse vector slot
+        self.sparse_enabled = False
 
-    def _ensure_collection(self):
+    async def connect(self, qdrant_client: AsyncQdrantClient):
+        """Attach the shared Qdrant client and bootstrap the collection"""
+        self.qdrant_client = qdrant_client
+        await self._ensure_collection()
+
+    async def _ensure_collection(self):
         """Create collection according to Qdrant documentation"""
         try:
             # Check if collection already exists
-            collections = self.qdrant_client.get_collections()
-            if any(col.name == self.collection_name for col in collections.collections):
-                return
+            if not await self.qdrant_client.collection_exists(self.collection_name):
+                # Create collection with its payload indexes
+                await create_collection(self.qdrant_client, self.collection_name, self.embedding_dimension)
+            else:
+                await ensure_payload_indexes(self.qdrant_client, self.collection_name)
 
-            # Create collection
-            self.qdrant_client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(
-                    size=self.embedding_dimension,
-                    distance=Distance.COSINE,
-                ),
-            )
+            self.sparse_enabled = await ensure_sparse_vectors(self.qdrant_client, self.collection_name)
 
         except Exception as e:
             raise Exception(f"Error creating collection: {e}")
@@ -52,7 +85,6 @@ class EmbeddingService:
         """Generate normalized mock embedding"""
         if text:
             # Create embedding based on text content (reproducible)
-            import hashlib
             seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
             random.seed(seed)
         else:
@@ -68,6 +100,59 @@ class EmbeddingService:
         
         return embedding
 
+    def _build_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group consecutive input indices into batches bounded by token count"""
+        batches = []
+        current_batch = []
+        current_tokens = 0
+
+        for idx, text in enumerate(texts):
+            tokens = count_tokens(text, self.embedding_model)
+            if current_batch and (
+                current_tokens + tokens > self.batch_max_tokens
+                or len(current_batch) >= self.batch_max_items
+            ):
+                batches.append(current_batch)
+                current_batch = []
+                current_tokens = 0
+
+            current_batch.append(idx)
+            current_tokens += tokens
+
+        if current_batch:
+            batches.append(current_batch)
+
+        return batches
+
+    async def _embed_batch(self, texts: List[str]) -> Tuple[List[List[float]], bool]:
+        """Embed one batch through OpenAI, falling back to mock embeddings"""
+        try:
+            response = await self.openai_client.embeddings.create(
+                input=texts,
+                model=self.embedding_model,
+            )
+            return [data.embedding for data in sorted(response.data, key=lambda d: d.index)], True
+
+        except Exception:
+            # Fallback to mock embeddings in case of error
+            return [self._generate_mock_embedding(text) for text in texts], False
+
+    async def _embed_uncached(self, texts: List[str]) -> Tuple[List[List[float]], List[bool]]:
+        """Embed texts in concurrent token-bounded batches, keeping input order"""
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        from_provider = [False] * len(texts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_batch(indices: List[int]):
+            async with semaphore:
+                batch_embeddings, ok = await self._embed_batch([texts[i] for i in indices])
+            for i, embedding in zip(indices, batch_embeddings):
+                embeddings[i] = embedding
+                from_provider[i] = ok
+
+        await asyncio.gather(*(run_batch(batch) for batch in self._build_batches(texts)))
+        return embeddings, from_provider
+
     async def generate_embeddings(
         self, texts: List[str]
     ) -> Optional[List[List[float]]]:
@@ -75,65 +160,219 @@ class EmbeddingService:
         if not texts:
             return None
 
-        try:
-            # Use OpenAI if available
-            if not self.use_mock_embeddings and self.openai_client:
-                response = self.openai_client.embeddings.create(
-                    input=texts,
-                    model=self.embedding_model,
-                )
-                embeddings = [data.embedding for data in response.data]
-                return embeddings
+        # Fallback to mock embeddings
+        if self.use_mock_embeddings or not self.openai_client:
+            return [self._generate_mock_embedding(text) for text in texts]
 
-            # Fallback to mock embeddings
-            embeddings = [self._generate_mock_embedding(text) for text in texts]
+        # Serve hits from the cache and send each distinct miss to the provider once
+        embeddings = await embedding_cache.get_many(self.embedding_model, texts)
+        misses: Dict[str, List[int]] = {}
+        for idx, embedding in enumerate(embeddings):
+            if embedding is None:
+                misses.setdefault(texts[idx], []).append(idx)
+
+        if not misses:
             return embeddings
 
-        except Exception:
-            # Fallback to mock embeddings in case of error
-            embeddings = [self._generate_mock_embedding(text) for text in texts]
+        miss_texts = list(misses)
+        computed, from_provider = await self._embed_uncached(miss_texts)
+        for text, embedding in zip(miss_texts, computed):
+            for idx in misses[text]:
+                embeddings[idx] = embedding
+
+        # Mock fallbacks are never cached
+        await embedding_cache.set_many(
+            self.embedding_model,
+            [text for text, ok in zip(miss_texts, from_provider) if ok],
+            [embedding for embedding, ok in zip(computed, from_provider) if ok],
+        )
+        return embeddings
+
+    async def embed_query(self, query: str) -> Optional[List[float]]:
+        """Embed a search query through the two-tier query cache"""
+        if not query.strip():
+            return None
+
+        if self.use_mock_embeddings or not self.openai_client:
+            return self._generate_mock_embedding(query)
+
+        cached = await query_embedding_cache.get(self.embedding_model, query)
+        if cached is not None:
+            return cached
+
+        embeddings, from_provider = await self._embed_uncached([query])
+        if from_provider[0]:
+            await query_embedding_cache.set(self.embedding_model, query, embeddings[0])
+        return embeddings[0]
+
+    async def embed_queries(self, queries: List[str]) -> List[Optional[List[float]]]:
+        """Embed many search queries, sending all cache misses in one provider batch"""
+        if self.use_mock_embeddings or not self.openai_client:
+            return [self._generate_mock_embedding(query) if query.strip() else None for query in queries]
+
+        embeddings = await query_embedding_cache.get_many(self.embedding_model, queries)
+        misses: Dict[str, List[int]] = {}
+        for idx, (query, embedding) in enumerate(zip(queries, embeddings)):
+            if embedding is None and query.strip():
+                misses.setdefault(query, []).append(idx)
+
+        if not misses:
             return embeddings
 
+        miss_queries = list(misses)
+        computed, from_provider = await self._embed_uncached(miss_queries)
+        for query, embedding in zip(miss_queries, computed):
+            for idx in misses[query]:
+                embeddings[idx] = embedding
+
+        await query_embedding_cache.set_many(
+            self.embedding_model,
+            [query for query, ok in zip(miss_queries, from_provider) if ok],
+            [embedding for embedding, ok in zip(computed, from_provider) if ok],
+        )
+        return embeddings
+
+    def point_ids(self, document_id: int, chunks: List[Chunk], occurrences: Optional[Dict[str, int]] = None) -> List[str]:
+        """
+        Deterministic point ids from (document, embedding model, chunk text).
+
+        Repeated texts within a document are told apart by their occurrence
+        count; pass the same occurrences dict for every batch of a document.
+        """
+        occurrences = {} if occurrences is None else occurrences
+        ids = []
+        for chunk in chunks:
+            content_hash = chunk_hash(chunk.text)
+            occurrence = occurrences.get(content_hash, 0)
+            occurrences[content_hash] = occurrence + 1
+            name = f"{document_id}:{self.embedding_model}:{content_hash}:{occurrence}"
+            ids.append(str(uuid.uuid5(CHUNK_ID_NAMESPACE, name)))
+        return ids
+
+    def _position_payload(self, chunk: Chunk, metadata: Dict) -> Dict:
+        return {
+            "chunk_index": chunk.index,
+            "start_offset": chunk.start_offset,
+            "end_offset": chunk.end_offset,
+            "page_number": chunk.page_number,
+            "page_end": chunk.page_end,
+            "title": metadata.get("filename", "unknown"),
+            "file_type": metadata.get("content_type", "unknown"),
+        }
+
+    async def get_chunk_points(self, document_id: int) -> Dict[PointId, Dict]:
+        """Ids of a document's stored points with their position payload"""
+        points: Dict[PointId, Dict] = {}
+        offset = None
+        while True:
+            records, offset = await self.qdrant_client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(
+                    must=[FieldCondition(key="document_id", match=MatchValue(value=document_id))]
+                ),
+                limit=SCROLL_PAGE_SIZE,
+                offset=offset,
+                with_payload=list(CHUNK_POSITION_FIELDS),
+                with_vectors=False,
+            )
+            for record in records:
+                points[record.id] = record.payload or {}
+            if offset is None:
+                return points
+
+    async def upsert_chunks(
+        self,
+        document_id: int,
+        chunks: List[Chunk],
+        embeddings: List[List[float]],
+        metadata: Dict,
+        point_ids: Optional[List[str]] = None,
+    ) -> int:
+        """Upsert already-embedded chunks, returns the number of points stored"""
+        if point_ids is None:
+            point_ids = self.point_ids(document_id, chunks)
+
+        points = []
+        for point_id, embedding, chunk in zip(point_ids, embeddings, chunks):
+            vector = embedding
+            if self.sparse_enabled:
+                vector = {"": embedding, SPARSE_VECTOR_NAME: sparse_encoder.encode_document(chunk.text)}
+
+            points.append(
+                PointStruct(
+                    id=point_id,
+                    vector=vector,
+                    payload={
+                        "document_id": document_id,
+                        "text": chunk.text,
+                        "chunk_hash": chunk_hash(chunk.text),
+                        "chunk_length": len(chunk.text),
+                        "token_count": chunk.token_count,
+                        **self._position_payload(chunk, metadata),
+                        "user_id": metadata.get("user_id"),
+                        "is_mock_embedding": self.use_mock_embeddings,
+                    },
+                )
+            )
+
+        if not points:
+            return 0
+
+        await self.qdrant_client.upsert(
+            collection_name=self.collection_name,
+            points=points,
+            wait=True,
+        )
+
+        return len(points)
+
+    async def update_chunk_positions(
+        self,
+        chunks: List[Chunk],
+        point_ids: List[str],
+        stored: Dict[PointId, Dict],
+        metadata: Dict,
+    ) -> int:
+        """Rewrite the position payload of kept chunks that moved, without touching their vectors"""
+        operations = []
+        for point_id, chunk in zip(point_ids, chunks):
+            payload = self._position_payload(chunk, metadata)
+            current = stored.get(point_id, {})
+            if any(current.get(key) != value for key, value in payload.items()):
+                operations.append(SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point_id])))
+
+        if operations:
+            await self.qdrant_client.batch_update_points(
+                collection_name=self.collection_name,
+                update_operations=operations,
+                wait=True,
+            )
+        return len(operations)
+
+    async def delete_points(self, point_ids: List[PointId]) -> int:
+        if not point_ids:
+            return 0
+        await self.qdrant_client.delete(
+            collection_name=self.collection_name,
+            points_selector=PointIdsList(points=point_ids),
+            wait=True,
+        )
+        return len(point_ids)
+
     async def store_embeddings(
-        self, document_id: int, chunks: List[str], metadata: Dict
+        self, document_id: int, chunks: List[Chunk], metadata: Dict
     ) -> bool:
         """Store embeddings with user_id"""
         try:
             if not chunks:
                 return False
 
-            embeddings = await self.generate_embeddings(chunks)
+            embeddings = await self.generate_embeddings([chunk.text for chunk in chunks])
             if not embeddings:
                 return False
 
-            points = []
-            for idx, (embedding, chunk) in enumerate(zip(embeddings, chunks)):
-                point_id = document_id * 1000 + idx
-
-                points.append(
-                    PointStruct(
-                        id=point_id,
-                        vector=embedding,
-                        payload={
-                            "document_id": document_id,
-                            "chunk_index": idx,
-                            "text": chunk[:1000],
-                            "chunk_length": len(chunk),
-                            "title": metadata.get("filename", "unknown"),
-                            "file_type": metadata.get("content_type", "unknown"),
-                            "user_id": metadata.get("user_id"),
-                            "is_mock_embedding": self.use_mock_embeddings,
-                        },
-                    )
-                )
-
-            self.qdrant_client.upsert(
-                collection_name=self.collection_name, 
-                points=points, 
-                wait=True,
-            )
-
-            return True
+            stored = await self.upsert_chunks(document_id, chunks, embeddings, metadata)
+            return stored > 0
 
         except Exception:
             return False
@@ -151,25 +390,25 @@ class EmbeddingService:
                 return []
 
             # Generate query embedding
-            query_embeddings = await self.generate_embeddings([query])
-            if not query_embeddings:
+            query_embedding = await self.embed_query(query)
+            if query_embedding is None:
                 return []
 
             # Build filter if user_id is specified
-            from qdrant_client.models import Filter, FieldCondition, MatchValue
             query_filter = None
             if user_id is not None:
                 query_filter = Filter(
                     must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))]
                 )
 
-            results = self.qdrant_client.search(
+            results = await self.qdrant_client.search(
                 collection_name=self.collection_name,
-                query_vector=query_embeddings[0],
+                query_vector=query_embedding,
                 limit=limit,
                 score_threshold=score_threshold,
                 with_payload=True,
-                query_filter=query_filter
+                query_filter=query_filter,
+                search_params=search_params(),
             )
 
             formatted_results = [
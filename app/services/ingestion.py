@@ -1,30 +1,120 @@
+import asyncio
 import PyPDF2
 import docx
-from typing import Optional
+from collections import deque
+from concurrent.futures import Executor
+from itertools import islice
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional
+from config import settings
+
+
+class PageText(NamedTuple):
+    page_number: int
+    text: str
+
+
+def _count_pdf_pages(file_path: str) -> int:
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def _extract_pdf_range(file_path: str, start: int, end: int) -> List[PageText]:
+    """Extract pages [start, end) of a PDF, run inside the ingestion process pool"""
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [
+            PageText(page_number + 1, reader.pages[page_number].extract_text() or "")
+            for page_number in range(start, end)
+        ]
+
 
 class DocumentProcessor:
+    WORD_TYPES = ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'application/msword')
+
+    def __init__(
+        self,
+        parallel_min_pages: int = settings.PDF_PARALLEL_MIN_PAGES,
+        pages_per_task: int = settings.PDF_PAGES_PER_TASK,
+    ):
+        self.parallel_min_pages = parallel_min_pages
+        self.pages_per_task = max(1, pages_per_task)
+
     async def extract_text(self, file_path: str, file_type: str) -> Optional[str]:
         """Extract text from different document types"""
         try:
-            if file_type == 'application/pdf':
-                return self._extract_from_pdf(file_path)
-            elif file_type in ['application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'application/msword']:
-                return self._extract_from_docx(file_path)
-            elif file_type.startswith('text/'):
-                return self._extract_from_text(file_path)
-            else:
-                return None
+            pages = [page.text async for page in self.aiter_pages(file_path, file_type)]
+            return "\n".join(pages) if pages else None
         except Exception:
             return None
 
-    def _extract_from_pdf(self, file_path: str) -> str:
+    def supports(self, file_type: Optional[str]) -> bool:
+        return bool(file_type) and (file_type in self.WORD_TYPES or file_type == 'application/pdf' or file_type.startswith('text/'))
+
+    def iter_pages(self, file_path: str, file_type: str) -> Iterator[PageText]:
+        """Yield text page by page (non-paginated formats yield a single page)"""
+        if file_type == 'application/pdf':
+            yield from self._extract_from_pdf(file_path)
+        elif file_type in self.WORD_TYPES:
+            yield PageText(1, self._extract_from_docx(file_path))
+        elif file_type and file_type.startswith('text/'):
+            yield PageText(1, self._extract_from_text(file_path))
+
+    async def aiter_pages(
+        self,
+        file_path: str,
+        file_type: str,
+        executor: Optional[Executor] = None,
+        max_in_flight: int = settings.INGESTION_PROCESS_WORKERS * 2,
+    ) -> AsyncIterator[PageText]:
+        """
+        Stream pages without blocking the event loop.
+        Large PDFs are split into page ranges extracted in parallel on the
+        executor; at most max_in_flight ranges are held at once and pages are
+        yielded in document order.
+        """
+        loop = asyncio.get_running_loop()
+
+        if file_type == 'application/pdf' and executor is not None:
+            page_count = await asyncio.to_thread(_count_pdf_pages, file_path)
+            if page_count >= self.parallel_min_pages:
+                ranges = iter([
+                    (start, min(start + self.pages_per_task, page_count))
+                    for start in range(0, page_count, self.pages_per_task)
+                ])
+                pending = deque(
+                    loop.run_in_executor(executor, _extract_pdf_range, file_path, start, end)
+                    for start, end in islice(ranges, max(1, max_in_flight))
+                )
+                try:
+                    while pending:
+                        pages = await pending.popleft()
+                        next_range = next(ranges, None)
+                        if next_range is not None:
+                            pending.append(
+                                loop.run_in_executor(executor, _extract_pdf_range, file_path, *next_range)
+                            )
+                        for page in pages:
+                            yield page
+                finally:
+                    for future in pending:
+                        future.cancel()
+                return
+
+        # Sequential path: advance the page generator in a worker thread
+        iterator = self.iter_pages(file_path, file_type)
+        done = object()
+        while True:
+            page = await asyncio.to_thread(next, iterator, done)
+            if page is done:
+                break
+            yield page
+
+    def _extract_from_pdf(self, file_path: str) -> Iterator[PageText]:
         """Extract text from PDF"""
-        text = ""
         with open(file_path, 'rb') as file:
             reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        return text
+            for page_number, page in enumerate(reader.pages, 1):
+                yield PageText(page_number, page.extract_text() or "")
 
     def _extract_from_docx(self, file_path: str) -> str:
         """Extract text from DOCX"""
@@ -34,4 +124,4 @@ class DocumentProcessor:
     def _extract_from_text(self, file_path: str) -> str:
         """Extract text from text file"""
         with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
\ No newline at end of file
+            return file.read()
@@ -0,0 +1,326 @@
+import asyncio
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from app.db import models
+from app.db.database import SessionLocal
+from app.db.models import DocumentStatus
+from app.services.embeddings import PointId, embedding_service
+from app.services.ingestion import DocumentProcessor
+from app.services.chunking import BaseChunker, Chunk, get_chunker
+from app.services.redis_service import invalidate_user
+
+
+@dataclass
+class IngestionJob:
+    document_id: int
+    file_path: str
+    filename: str
+    content_type: str
+    user_id: int
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    enqueued_at: datetime = field(default_factory=datetime.utcnow)
+    # Receives the job's outcome dict once it has finished (bulk uploads)
+    results: Optional[asyncio.Queue] = field(default=None, repr=False, compare=False)
+    # File replaced by a re-ingest; kept until the job has finished
+    previous_source: Optional[str] = None
+
+
+@dataclass
+class ChunkDiff:
+    """Points already stored for a document, and the point ids produced by the current run"""
+    stored: Dict[PointId, Dict]
+    occurrences: Dict[str, int] = field(default_factory=dict)
+    seen: Set[PointId] = field(default_factory=set)
+    # Points upserted by the current run, rolled back if it fails
+    added: List[PointId] = field(default_factory=list)
+    reused: int = 0
+
+
+document_processor = DocumentProcessor()
+
+
+def _consume_page(chunker: BaseChunker, content: models.DocumentContentWriter, text: str, page_number: int) -> List[Chunk]:
+    """Tokenize and compress one page; blocking, run it in a thread"""
+    content.write(text)
+    return chunker.feed(text, page_number)
+
+
+class IngestionJobQueue:
+    """
+    Background ingestion pipeline.
+
+    Jobs go through an in-process asyncio queue (local stand-in for an external
+    broker on single-box deployments). Async workers drive each job while the
+    CPU-heavy PDF page extraction runs in a process pool. The queue is bounded,
+    so enqueue() waits while the workers are saturated.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = settings.INGESTION_WORKERS,
+        process_workers: int = settings.INGESTION_PROCESS_WORKERS,
+        embed_batch_size: int = settings.INGESTION_EMBED_BATCH_SIZE,
+        queue_size: int = settings.INGESTION_QUEUE_SIZE,
+    ):
+        self.num_workers = max(1, num_workers)
+        self.queue_size = max(0, queue_size)
+        self.process_workers = max(1, process_workers)
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.queue: Optional[asyncio.Queue] = None
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+        self.workers: List[asyncio.Task] = []
+        self.recovery: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self.workers)
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def start(self):
+        if self.is_running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+        self.workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.num_workers)
+        ]
+        # In the background: requeueing waits on the bounded queue
+        self.recovery = asyncio.create_task(self.recover())
+
+    async def stop(self):
+        tasks = self.workers + ([self.recovery] if self.recovery is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.recovery = None
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+
+    async def enqueue(self, job: IngestionJob) -> str:
+        if not self.is_running:
+            await self.start()
+        await self.queue.put(job)
+        return job.job_id
+
+    async def recover(self) -> Dict[str, int]:
+        """
+        Requeue the documents whose job was lost when the process stopped.
+
+        The queue lives in memory, so PENDING/EXTRACTING/EMBEDDING rows left
+        by a previous process would otherwise never finish (and could never be
+        re-ingested). Documents whose source file is gone are marked FAILED.
+        """
+        jobs: List[IngestionJob] = []
+        failed = 0
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(models.Document)
+                .where(models.Document.status.in_(DocumentStatus.IN_PROGRESS))
+                .order_by(models.Document.id)
+            )
+            documents = result.scalars().all()
+            for document in documents:
+                if document.source and os.path.exists(document.source):
+                    if document.status != DocumentStatus.PENDING:
+                        document.transition_to(DocumentStatus.PENDING)
+                    document.job_id = uuid.uuid4().hex
+                    jobs.append(IngestionJob(
+                        job_id=document.job_id,
+                        document_id=document.id,
+                        file_path=document.source,
+                        filename=document.title,
+                        content_type=document.file_type,
+                        user_id=document.user_id,
+                    ))
+                else:
+                    document.transition_to(DocumentStatus.FAILED, error="Ingestion interrupted and source file is missing")
+                    failed += 1
+            await db.commit()
+            for user_id in {document.user_id for document in documents}:
+                await invalidate_user(user_id)
+
+        for job in jobs:
+            await self.enqueue(job)
+        return {"requeued": len(jobs), "failed": failed}
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self.queue.get()
+            outcome = {"document_id": job.document_id, "filename": job.filename}
+            try:
+                outcome.update(await self._process(job))
+            except Exception as e:
+                # Failure is recorded on the document row
+                outcome.update(status=DocumentStatus.FAILED, chunks=0, error=str(e))
+            finally:
+                self.queue.task_done()
+                if job.results is not None:
+                    job.results.put_nowait(outcome)
+
+    async def _update(self, db: AsyncSession, document: models.Document, status: Optional[str] = None, **progress):
+        if status is not None:
+            document.transition_to(status, error=progress.pop("error", None))
+        for key, value in progress.items():
+            setattr(document, key, value)
+        await db.commit()
+        if status is not None:
+            # Listings show the status and new content can change answers
+            await invalidate_user(document.user_id)
+
+    async def _store_batch(
+        self, db, document: models.Document, job: IngestionJob, batch: List[Chunk], metadata: Dict,
+        pages_extracted: int, diff: ChunkDiff,
+    ):
+        """Embed and upsert the new chunks of one batch while extraction keeps streaming"""
+        if document.status == DocumentStatus.EXTRACTING:
+            await self._update(db, document, DocumentStatus.EMBEDDING)
+
+        point_ids = embedding_service.point_ids(job.document_id, batch, diff.occurrences)
+        diff.seen.update(point_ids)
+        new = [(point_id, chunk) for point_id, chunk in zip(point_ids, batch) if point_id not in diff.stored]
+        kept = [(point_id, chunk) for point_id, chunk in zip(point_ids, batch) if point_id in diff.stored]
+
+        # Unchanged chunks keep their vectors; only their position may need updating
+        if kept:
+            await embedding_service.update_chunk_positions(
+                [chunk for _, chunk in kept], [point_id for point_id, _ in kept], diff.stored, metadata
+            )
+            diff.reused += len(kept)
+
+        embeddings = []
+        if new:
+            embeddings = await embedding_service.generate_embeddings([chunk.text for _, chunk in new])
+            if not embeddings:
+                raise RuntimeError("Embedding generation returned no vectors")
+        await self._update(
+            db, document,
+            pages_extracted=pages_extracted,
+            chunks_total=batch[-1].index + 1,
+            chunks_embedded=(document.chunks_embedded or 0) + len(embeddings),
+        )
+
+        diff.added.extend(point_id for point_id, _ in new)
+        stored = await embedding_service.upsert_chunks(
+            job.document_id, [chunk for _, chunk in new], embeddings, metadata,
+            point_ids=[point_id for point_id, _ in new],
+        )
+        await self._update(db, document, points_stored=(document.points_stored or 0) + stored + len(kept))
+
+    def _discard_previous_source(self, job: IngestionJob):
+        if job.previous_source and job.previous_source != job.file_path and os.path.exists(job.previous_source):
+            os.remove(job.previous_source)
+
+    def _outcome(self, document: models.Document) -> Dict:
+        return {"status": document.status, "chunks": document.chunks_total or 0, "error": document.error_message}
+
+    async def _process(self, job: IngestionJob) -> Dict:
+        """
+        Extract -> chunk -> embed -> upsert, streamed page by page with progress on the document row.
+
+        Chunks are diffed by point id against what the document already has in
+        Qdrant, so re-ingesting an edited file only embeds the new chunks and
+        deletes the ones that disappeared. Stale chunks are only deleted once
+        every new one is stored; a failed run removes the points it added, so
+        the document keeps its previous vector set rather than a partial one.
+        """
+        db = SessionLocal()
+        diff: Optional[ChunkDiff] = None
+        try:
+            document = await db.get(models.Document, job.document_id)
+            if document is None:
+                return {"status": DocumentStatus.FAILED, "chunks": 0, "error": "Document not found"}
+
+            await self._update(
+                db, document, DocumentStatus.EXTRACTING,
+                pages_extracted=0, chunks_total=0, chunks_embedded=0, points_stored=0,
+            )
+            diff = ChunkDiff(stored=await embedding_service.get_chunk_points(job.document_id))
+
+            metadata: Dict = {
+                "filename": job.filename,
+                "content_type": job.content_type,
+                "original_filename": job.filename,
+                "user_id": job.user_id,
+            }
+
+            # Chunks are embedded as soon as a batch is ready, before the last page is parsed
+            chunker = get_chunker(
+                settings.CHUNKER,
+                max_tokens=settings.CHUNK_MAX_TOKENS,
+                overlap_tokens=settings.CHUNK_OVERLAP_TOKENS,
+                chunk_size=settings.CHUNK_SIZE_CHARS,
+                model=settings.EMBEDDING_MODEL,
+                anchor_interval=settings.CHUNK_ANCHOR_INTERVAL,
+            )
+            # Pages are compressed as they stream by, never held as a whole document
+            content = models.DocumentContentWriter()
+            pending: List[Chunk] = []
+            async for page in document_processor.aiter_pages(
+                job.file_path, job.content_type, executor=self.process_pool
+            ):
+                pending.extend(await asyncio.to_thread(_consume_page, chunker, content, page.text, page.page_number))
+                while len(pending) >= self.embed_batch_size:
+                    batch, pending = pending[:self.embed_batch_size], pending[self.embed_batch_size:]
+                    await self._store_batch(db, document, job, batch, metadata, content.pages, diff)
+
+            pending.extend(await asyncio.to_thread(chunker.flush))
+            if pending:
+                await self._store_batch(db, document, job, pending, metadata, content.pages, diff)
+
+            if not document.chunks_total:
+                if os.path.exists(job.file_path):
+                    os.remove(job.file_path)
+                await self._update(
+                    db, document, DocumentStatus.FAILED,
+                    error="Could not extract text from document",
+                    pages_extracted=content.pages,
+                )
+                self._discard_previous_source(job)
+                return self._outcome(document)
+
+            # Chunks of the previous version that no longer exist (including legacy integer ids)
+            await embedding_service.delete_points([point_id for point_id in diff.stored if point_id not in diff.seen])
+
+            # The full text is stored outside the documents row
+            content_record = content.finish()
+            content_record.document_id = document.id
+            await db.merge(content_record)
+            await self._update(
+                db, document, DocumentStatus.READY,
+                pages_extracted=content.pages,
+            )
+            self._discard_previous_source(job)
+            return self._outcome(document)
+
+        except Exception as e:
+            await db.rollback()
+            if diff is not None and diff.added:
+                try:
+                    await embedding_service.delete_points(diff.added)
+                except Exception:
+                    pass
+            document = await db.get(models.Document, job.document_id, populate_existing=True)
+            if document is not None and document.status != DocumentStatus.FAILED:
+                document.transition_to(DocumentStatus.FAILED, error=str(e))
+                await db.commit()
+                await invalidate_user(document.user_id)
+            self._discard_previous_source(job)
+            raise
+        finally:
+            await db.close()
+
+
+ingestion_queue = IngestionJobQueue()
@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import openai
+from tenacity import (
+    AsyncRetrying,
+    RetryCallState,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from config import settings
+
+# Lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BATCH: "batch",
+    PRIORITY_BACKGROUND: "background",
+}
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+T = TypeVar("T")
+
+
+class LLMRateLimitedError(Exception):
+    """Raised when the provider keeps rate limiting after all retries"""
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("LLM provider rate limit reached")
+        self.retry_after = retry_after
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Seconds requested by the provider's Retry-After headers, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class LLMDispatcher:
+    """
+    Admission control for LLM calls.
+
+    Calls wait in a priority queue for a slot under both the global limit and
+    a per-user cap. The global limit adapts (AIMD): it is halved on every 429
+    and grows back by about one slot per window of successful calls. Retryable
+    errors are retried with jittered exponential backoff that honours the
+    provider's Retry-After, and the slot is released while backing off.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+        min_concurrency: int = settings.LLM_MIN_CONCURRENCY,
+        per_user_concurrency: int = settings.LLM_PER_USER_CONCURRENCY,
+        max_attempts: int = settings.LLM_MAX_RETRIES + 1,
+        backoff_max: float = settings.LLM_BACKOFF_MAX_SECONDS,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.per_user_concurrency = max(1, per_user_concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_max = backoff_max
+
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._user_in_flight: Dict[Optional[int], int] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future, Optional[int]]] = []
+        self._sequence = itertools.count()
+        self._backoff = wait_random_exponential(multiplier=0.5, max=backoff_max)
+
+        self.stats = {"completed": 0, "failed": 0, "retries": 0, "rate_limited": 0}
+
+    def _can_start(self, user_id: Optional[int]) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        return user_id is None or self._user_in_flight.get(user_id, 0) < self.per_user_concurrency
+
+    def _start(self, user_id: Optional[int]):
+        self.in_flight += 1
+        self._user_in_flight[user_id] = self._user_in_flight.get(user_id, 0) + 1
+
+    def _grant(self):
+        """Hand free slots to waiters in priority order, skipping users at their cap"""
+        skipped = []
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = heapq.heappop(self._waiters)
+            future, user_id = waiter[2], waiter[3]
+            if future.done():
+                continue
+            if not self._can_start(user_id):
+                skipped.append(waiter)
+                continue
+            self._start(user_id)
+            future.set_result(None)
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
+
+    async def _acquire(self, priority: int, user_id: Optional[int]):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future, user_id))
+        self._grant()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just before cancellation
+                self._release(user_id)
+            raise
+
+    def _release(self, user_id: Optional[int]):
+        self.in_flight -= 1
+        remaining = self._user_in_flight.get(user_id, 1) - 1
+        if remaining:
+            self._user_in_flight[user_id] = remaining
+        else:
+            self._user_in_flight.pop(user_id, None)
+        self._grant()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE, user_id: Optional[int] = None):
+        """Hold one concurrency slot"""
+        await self._acquire(priority, user_id)
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+    def _on_success(self):
+        self.stats["completed"] += 1
+        self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        self._grant()
+
+    def _on_rate_limited(self):
+        self.stats["rate_limited"] += 1
+        self.limit = max(float(self.min_concurrency), self.limit / 2)
+
+    def _wait(self, retry_state: RetryCallState) -> float:
+        error = retry_state.outcome.exception()
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return self._backoff(retry_state)
+
+    def _before_sleep(self, retry_state: RetryCallState):
+        self.stats["retries"] += 1
+
+    def _retrying(self) -> AsyncRetrying:
+        return AsyncRetrying(
+            retry=retry_if_exception_type(RETRYABLE_ERRORS),
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self._wait,
+            before_sleep=self._before_sleep,
+            reraise=True,
+        )
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        priority: int = PRIORITY_INTERACTIVE,
+        user_id: Optional[int] = None,
+    ) -> T:
+        """Run fn under a slot, retrying retryable provider errors"""
+        try:
+            async for attempt in self._retrying():
+                with attempt:
+                    async with self.slot(priority, user_id):
+                        try:
+                            result = await fn()
+                        except openai.RateLimitError:
+                            self._on_rate_limited()
+                            raise
+                    self._on_success()
+                    return result
+        except openai.RateLimitError as e:
+            self.stats["failed"] += 1
+            raise LLMRateLimitedError(_retry_after(e)) from e
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+
+    async def stream(
+        self,
+        open_stream: Callable[[], Awaitable[AsyncIterator[T]]],
+        priority: int = PRIORITY_INTERACTIVE,
+        user_id: Optional[int] = None,
+    ) -> AsyncIterator[T]:
+        """Hold a slot for a whole streamed completion; opening the stream is retried like call()"""
+        try:
+            async for attempt in self._retrying():
+                with attempt:
+                    await self._acquire(priority, user_id)
+                    try:
+                        stream = await open_stream()
+                    except BaseException as e:
+                        if isinstance(e, openai.RateLimitError):
+                            self._on_rate_limited()
+                        self._release(user_id)
+                        raise
+        except openai.RateLimitError as e:
+            self.stats["failed"] += 1
+            raise LLMRateLimitedError(_retry_after(e)) from e
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+
+        try:
+            async for item in stream:
+                yield item
+            self._on_success()
+        finally:
+            self._release(user_id)
+
+    def queue_depth(self) -> Dict[str, int]:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future, _ in self._waiters:
+            if not future.done():
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return depth
+
+    def get_stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "concurrency_limit": int(self.limit),
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth(),
+            **self.stats,
+        }
+
+
+llm_dispatcher = LLMDispatcher()
@@ -1,7 +1,21 @@
+import asyncio
 import os
-from typing import Dict, List, Optional
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
 import openai
 from openai import AsyncOpenAI
+from app.services.tokenizer import count_tokens
+from app.services.llm_dispatcher import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    LLMRateLimitedError,
+    llm_dispatcher,
+)
+
+# Per-message framing tokens added by the chat completion format
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
 
 class LLMService:
     def __init__(self):
@@ -12,6 +26,10 @@ class LLMService:
         self.temperature = float(os.getenv("LLM_TEMPERATURE", "0.1"))
         self.use_mock = not (self.openai_api_key and self.openai_api_key.startswith("sk-"))
 
+        # Recent time-to-first-token samples of streamed answers (seconds)
+        self._ttft_samples = deque(maxlen=1000)
+        self._streams = 0
+
     def _generate_mock_response(self, query: str, context: str) -> Dict:
         mock_responses = [
             f"According to the documents, {query} is addressed in the context of emerging technologies. [Document.pdf]",
@@ -31,7 +49,9 @@ class LLMService:
         self, 
         query: str, 
         context: str, 
-        response_style: str = "concise"
+        response_style: str = "concise",
+        priority: int = PRIORITY_INTERACTIVE,
+        user_id: Optional[int] = None
     ) -> Dict:
         try:
             if not query.strip():
@@ -45,9 +65,51 @@ class LLMService:
             if self.use_mock:
                 return self._generate_mock_response(query, context)
 
-            style_instruction = self._get_style_instruction(response_style)
+            messages = self._build_messages(query, context, response_style)
+            response = await llm_dispatcher.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.chat_model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    timeout=30.0
+                ),
+                priority=priority,
+                user_id=user_id,
+            )
+
+            answer = response.choices[0].message.content.strip()
             
-            system_prompt = f"""# ROLE
+            sources = self.extract_sources(answer)
+            
+            return {
+                "answer": answer,
+                "sources": sources,
+                "success": True,
+                "is_mock": False,
+                "model": self.chat_model
+            }
+
+        except LLMRateLimitedError as e:
+            return {
+                "answer": "The language model is receiving too many requests right now. Please try again in a few seconds.",
+                "sources": [],
+                "success": False,
+                "error": "rate_limited",
+                "retry_after": e.retry_after
+            }
+        except Exception as e:
+            return {
+                "answer": f"I couldn't generate a response for the question '{query}'. Please try again.",
+                "sources": [],
+                "success": False,
+                "error": str(e)
+            }
+
+    def _build_messages(self, query: str, context: str, response_style: str = "concise") -> List[Dict]:
+        style_instruction = self._get_style_instruction(response_style)
+        
+        system_prompt = f"""# ROLE
 You are an expert document analysis assistant. You answer exclusively based on the documents provided by the user.
 
 # INSTRUCTIONS
@@ -63,7 +125,7 @@ You are an expert document analysis assistant. You answer exclusively based on t
 - Precise citations for each claim
 - Professional and informative tone"""
 
-            user_message = f"""## QUESTION TO ANSWER:
+        user_message = f"""## QUESTION TO ANSWER:
 {query}
 
 ## DOCUMENT CONTEXT:
@@ -73,36 +135,76 @@ You are an expert document analysis assistant. You answer exclusively based on t
 Answer the question relying exclusively on the document context above.
 Precisely cite your sources with the format [Filename] for each information."""
 
-            response = await self.client.chat.completions.create(
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+
+    def reserved_tokens(self, query: str, response_style: str = "concise") -> int:
+        """Prompt tokens outside the document context, plus room for the completion"""
+        messages = self._build_messages(query, "", response_style)
+        prompt_tokens = sum(
+            count_tokens(message["content"], self.chat_model) + MESSAGE_OVERHEAD_TOKENS
+            for message in messages
+        )
+        return prompt_tokens + REPLY_PRIMING_TOKENS + self.max_tokens
+
+    async def stream_answer(
+        self,
+        query: str,
+        context: str,
+        response_style: str = "concise",
+        priority: int = PRIORITY_INTERACTIVE,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Yield answer text deltas as the model produces them"""
+        if self.use_mock:
+            words = self._generate_mock_response(query, context)["answer"].split(" ")
+            for i, word in enumerate(words):
+                yield word if i == 0 else " " + word
+                await asyncio.sleep(0)
+            return
+
+        started = time.perf_counter()
+        first_token = True
+
+        messages = self._build_messages(query, context, response_style)
+        stream = llm_dispatcher.stream(
+            lambda: self.client.chat.completions.create(
                 model=self.chat_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=messages,
                 max_tokens=self.max_tokens,
                 temperature=self.temperature,
-                timeout=30.0
-            )
+                timeout=30.0,
+                stream=True
+            ),
+            priority=priority,
+            user_id=user_id,
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token:
+                    self._record_ttft(time.perf_counter() - started)
+                    first_token = False
+                yield delta
 
-            answer = response.choices[0].message.content.strip()
-            
-            sources = self._extract_sources(answer)
-            
-            return {
-                "answer": answer,
-                "sources": sources,
-                "success": True,
-                "is_mock": False,
-                "model": self.chat_model
-            }
+    def _record_ttft(self, seconds: float):
+        self._streams += 1
+        self._ttft_samples.append(seconds)
 
-        except Exception as e:
-            return {
-                "answer": f"I couldn't generate a response for the question '{query}'. Please try again.",
-                "sources": [],
-                "success": False,
-                "error": str(e)
-            }
+    def get_stats(self) -> Dict:
+        """Time-to-first-token of recent streamed answers"""
+        samples = sorted(self._ttft_samples)
+        if not samples:
+            return {"streams": self._streams, "ttft_p50_ms": None, "ttft_p95_ms": None}
+        return {
+            "streams": self._streams,
+            "ttft_p50_ms": round(samples[len(samples) // 2] * 1000, 1),
+            "ttft_p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+        }
 
     def _get_style_instruction(self, style: str) -> str:
         styles = {
@@ -114,7 +216,7 @@ Precisely cite your sources with the format [Filename] for each information."""
         }
         return styles.get(style, styles["concise"])
 
-    def _extract_sources(self, answer: str) -> List[str]:
+    def extract_sources(self, answer: str) -> List[str]:
         import re
         sources = re.findall(r'\[([^\]]+)\]', answer)
         return [source for source in sources if len(source) > 3 and ('.' in source or len(source) > 8)]
@@ -122,7 +224,8 @@ Precisely cite your sources with the format [Filename] for each information."""
     async def generate_summary(
         self, 
         contexts: List[Dict], 
-        focus: str = "key_points"
+        focus: str = "key_points",
+        user_id: Optional[int] = None
     ) -> Dict:
         try:
             if not contexts:
@@ -159,14 +262,18 @@ Organize your response in a structured way."""
                     "is_mock": True
                 }
 
-            response = await self.client.chat.completions.create(
-                model=self.chat_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": context_text}
-                ],
-                max_tokens=800,
-                temperature=0.3
+            response = await llm_dispatcher.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.chat_model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": context_text}
+                    ],
+                    max_tokens=800,
+                    temperature=0.3
+                ),
+                priority=PRIORITY_BACKGROUND,
+                user_id=user_id,
             )
 
             summary = response.choices[0].message.content.strip()
@@ -0,0 +1,35 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from config import settings
+from app.db import models
+
+
+class PasswordHasher:
+    """Runs bcrypt in a dedicated thread pool (bcrypt releases the GIL while hashing)"""
+
+    def __init__(self, max_workers: int = settings.BCRYPT_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        self.stats = {"hashed": 0, "checked": 0}
+
+    async def set_password(self, user: models.User, password: str):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, user.set_password, password)
+        self.stats["hashed"] += 1
+
+    async def check_password(self, user: models.User, password: str) -> bool:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, user.check_password, password)
+        self.stats["checked"] += 1
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict:
+        return {"workers": self.max_workers, **self.stats}
+
+
+password_hasher = PasswordHasher()
@@ -1,32 +1,93 @@
-import redis
+import asyncio
+import inspect
 import json
-from typing import Optional, Any, Dict
+import time
+import uuid
+import zlib
+from typing import Optional, Any, Callable, Dict, List, Mapping, Tuple
 from functools import wraps
 import hashlib
+
+import redis.asyncio as redis
+
 from config import settings
 
+# One-byte header on every encoded value; values without it are legacy plain JSON
+ENCODING_JSON = b"\x01"
+ENCODING_JSON_ZLIB = b"\x02"
+
+# Compare-and-delete so a caller never releases a lock that expired and was re-acquired
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+LOCK_POLL_INTERVAL = 0.05
+
+
+def encode_value(value: Any, compress_threshold: int = settings.REDIS_COMPRESS_THRESHOLD) -> bytes:
+    """Compact JSON, zlib-compressed once it exceeds compress_threshold bytes"""
+    data = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if 0 < compress_threshold <= len(data):
+        return ENCODING_JSON_ZLIB + zlib.compress(data, 6)
+    return ENCODING_JSON + data
+
+
+def decode_value(data: Optional[bytes]) -> Optional[Any]:
+    if not data:
+        return None
+    header, body = data[:1], data[1:]
+    if header == ENCODING_JSON_ZLIB:
+        return json.loads(zlib.decompress(body))
+    if header == ENCODING_JSON:
+        return json.loads(body)
+    return json.loads(data)
+
+
 class RedisService:
+    """
+    Async Redis access over one shared connection pool.
+
+    Values are stored as bytes: packed vectors as-is, everything else through
+    encode_value. Every call degrades to a cache miss when Redis is down.
+    """
+
     def __init__(self):
+        connection_params = {
+            'host': settings.REDIS_HOST,
+            'port': settings.REDIS_PORT,
+            'db': settings.REDIS_DB,
+            'max_connections': settings.REDIS_MAX_CONNECTIONS,
+            'socket_timeout': settings.REDIS_SOCKET_TIMEOUT,
+            'socket_connect_timeout': settings.REDIS_SOCKET_TIMEOUT,
+            'health_check_interval': 30,
+        }
+
+        if settings.REDIS_PASSWORD:
+            connection_params['password'] = settings.REDIS_PASSWORD
+
+        self.pool = redis.ConnectionPool(**connection_params)
+        self.redis_client = redis.Redis(connection_pool=self.pool)
+        self.scan_count = settings.REDIS_SCAN_COUNT
+        self.connected = False
+
+    async def connect(self) -> bool:
+        """Check the server once at startup; caching stays disabled if it is unreachable"""
         try:
-            connection_params = {
-                'host': settings.REDIS_HOST,
-                'port': settings.REDIS_PORT,
-                'db': settings.REDIS_DB,
-                'decode_responses': True,
-                'socket_timeout': 5,
-                'socket_connect_timeout': 5,
-            }
-            
-            if settings.REDIS_PASSWORD:
-                connection_params['password'] = settings.REDIS_PASSWORD
-            
-            self.redis_client = redis.Redis(**connection_params)
-            self.redis_client.ping()
+            await self.redis_client.ping()
+            self.connected = True
         except Exception:
-            self.redis_client = None
+            self.connected = False
+        return self.connected
+
+    async def close(self):
+        await self.redis_client.aclose()
+        await self.pool.disconnect()
+        self.connected = False
 
     def is_connected(self) -> bool:
-        return self.redis_client is not None
+        return self.connected
 
     def generate_cache_key(self, prefix: str, *args) -> str:
         key_str = ":".join(str(arg) for arg in args)
@@ -36,84 +97,277 @@ class RedisService:
     async def get(self, key: str) -> Optional[Any]:
         if not self.is_connected():
             return None
-            
+
         try:
-            value = self.redis_client.get(key)
-            if value:
-                return json.loads(value)
-            return None
+            return decode_value(await self.redis_client.get(key))
         except Exception:
             return None
 
     async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         if not self.is_connected():
             return False
-            
+
+        try:
+            ttl = ttl or settings.REDIS_CACHE_TTL
+            await self.redis_client.set(key, encode_value(value), ex=ttl)
+            return True
+        except Exception:
+            return False
+
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Decoded values aligned with keys (None for misses)"""
+        values = await self.get_many_bytes(keys)
+        decoded = []
+        for value in values:
+            try:
+                decoded.append(decode_value(value))
+            except Exception:
+                decoded.append(None)
+        return decoded
+
+    async def mset(self, mapping: Mapping[str, Any], ttl: Optional[int] = None) -> bool:
+        """Encode and store many values with one pipelined round trip"""
+        return await self.set_many_bytes({key: encode_value(value) for key, value in mapping.items()}, ttl)
+
+    async def get_many_bytes(self, keys: List[str]) -> List[Optional[bytes]]:
+        if not self.is_connected() or not keys:
+            return [None] * len(keys)
+
+        try:
+            return await self.redis_client.mget(keys)
+        except Exception:
+            return [None] * len(keys)
+
+    async def set_many_bytes(self, mapping: Mapping[str, bytes], ttl: Optional[int] = None) -> bool:
+        if not self.is_connected() or not mapping:
+            return False
+
+        try:
+            ttl = ttl or settings.REDIS_CACHE_TTL
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    pipe.set(key, value, ex=ttl)
+                await pipe.execute()
+            return True
+        except Exception:
+            return False
+
+    async def incr(self, key: str) -> Optional[int]:
+        if not self.is_connected():
+            return None
+
+        try:
+            return await self.redis_client.incr(key)
+        except Exception:
+            return None
+
+    def _generation_key(self, namespace: str) -> str:
+        return f"rag:gen:{namespace}"
+
+    async def get_generation(self, namespace: str) -> int:
+        """Current generation of a key namespace; embed it in keys to make them invalidatable"""
+        value = await self.get(self._generation_key(namespace))
+        return int(value) if value is not None else 0
+
+    async def bump_generation(self, namespace: str) -> Optional[int]:
+        """Invalidate every key built on the namespace's previous generation in O(1); orphans expire via TTL"""
+        return await self.incr(self._generation_key(namespace))
+
+    async def acquire_lock(self, key: str, timeout: float = settings.RESPONSE_CACHE_LOCK_TIMEOUT) -> Optional[str]:
+        """Short-lived mutex (SET NX PX); returns the owner token, or None if already held"""
+        if not self.is_connected():
+            return None
+
+        try:
+            token = uuid.uuid4().hex
+            if await self.redis_client.set(key, token, nx=True, px=int(timeout * 1000)):
+                return token
+            return None
+        except Exception:
+            return None
+
+    async def release_lock(self, key: str, token: str) -> bool:
+        """Release a lock only if this caller still owns it"""
+        if not self.is_connected():
+            return False
+
+        try:
+            return bool(await self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, key, token))
+        except Exception:
+            return False
+
+    async def wait_for(
+        self, key: str, lock_key: str, timeout: float = settings.RESPONSE_CACHE_LOCK_TIMEOUT
+    ) -> Optional[Any]:
+        """Poll for a value another caller is computing, until it appears or the lock goes away"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            value = await self.get(key)
+            if value is not None:
+                return value
+            try:
+                if not await self.redis_client.exists(lock_key):
+                    return None
+            except Exception:
+                return None
+        return None
+
+    async def push_bytes(self, key: str, value: bytes, max_length: int, ttl: Optional[int] = None) -> bool:
+        """Prepend to a capped binary list and refresh its TTL"""
+        if not self.is_connected():
+            return False
+
         try:
             ttl = ttl or settings.REDIS_CACHE_TTL
-            serialized_value = json.dumps(value)
-            self.redis_client.setex(key, ttl, serialized_value)
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.lpush(key, value)
+                pipe.ltrim(key, 0, max_length - 1)
+                pipe.expire(key, ttl)
+                await pipe.execute()
             return True
         except Exception:
             return False
 
+    async def range_bytes(self, key: str) -> List[bytes]:
+        if not self.is_connected():
+            return []
+
+        try:
+            return await self.redis_client.lrange(key, 0, -1)
+        except Exception:
+            return []
+
     async def delete(self, key: str) -> bool:
         if not self.is_connected():
             return False
-            
+
         try:
-            return self.redis_client.delete(key) > 0
+            return await self.redis_client.delete(key) > 0
         except Exception:
             return False
 
     async def clear_pattern(self, pattern: str) -> int:
+        """Delete matching keys with incremental SCAN and non-blocking UNLINK batches"""
         if not self.is_connected():
             return 0
-            
+
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                return self.redis_client.delete(*keys)
-            return 0
+            deleted = 0
+            batch = []
+            async for key in self.redis_client.scan_iter(match=pattern, count=self.scan_count):
+                batch.append(key)
+                if len(batch) >= self.scan_count:
+                    deleted += await self.redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += await self.redis_client.unlink(*batch)
+            return deleted
         except Exception:
             return 0
 
     async def get_stats(self) -> Dict:
         if not self.is_connected():
             return {"connected": False}
-            
+
         try:
-            info = self.redis_client.info()
+            info = await self.redis_client.info()
             return {
                 "connected": True,
                 "used_memory": info.get("used_memory_human", "N/A"),
                 "keys": info.get("db0", {}).get("keys", 0),
                 "hits": info.get("keyspace_hits", 0),
                 "misses": info.get("keyspace_misses", 0),
+                "max_connections": self.pool.max_connections,
             }
         except Exception:
             return {"connected": False}
 
 redis_service = RedisService()
 
-def cache_response(prefix: str, ttl: Optional[int] = None):
+
+def user_namespace(user_id: int) -> str:
+    """Generation namespace of everything cached from a user's document set"""
+    return f"docs:{user_id}"
+
+
+async def invalidate_user(user_id: int) -> Optional[int]:
+    """Orphan every cached answer and response of a user (upload, ingestion status change, delete)"""
+    return await redis_service.bump_generation(user_namespace(user_id))
+
+
+def cache_response(
+    prefix: str,
+    key_builder: Callable[..., Optional[Tuple[int, Tuple]]],
+    ttl: Optional[int] = None,
+    stale_ttl: int = settings.RESPONSE_CACHE_STALE_TTL,
+):
+    """
+    Cache an async function's JSON result per user.
+
+    key_builder receives the call's bound arguments as keyword arguments and
+    returns (user_id, key_parts), or None to bypass the cache. Keys embed the
+    user's generation, so invalidate_user drops them all at once.
+
+    Entries are fresh for ttl seconds, then served stale for stale_ttl more
+    while a single caller holding the refresh lock recomputes them. On a cold
+    miss, callers that lose the lock wait briefly for the winner's result
+    instead of all hitting the backend.
+    """
+    ttl = ttl or settings.REDIS_CACHE_TTL
+
     def decorator(func):
+        signature = inspect.signature(func)
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
             if not redis_service.is_connected():
                 return await func(*args, **kwargs)
-            
-            cache_key = redis_service.generate_cache_key(prefix, *args, *sorted(kwargs.items()))
-            
-            cached_result = await redis_service.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            result = await func(*args, **kwargs)
-            
-            if result is not None:
-                await redis_service.set(cache_key, result, ttl)
-            
-            return result
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            scope = key_builder(**bound.arguments)
+            if scope is None:
+                return await func(*args, **kwargs)
+
+            user_id, key_parts = scope
+            generation = await redis_service.get_generation(user_namespace(user_id))
+            cache_key = redis_service.generate_cache_key(f"resp:{prefix}:{user_id}:g{generation}", *key_parts)
+            lock_key = f"{cache_key}:lock"
+
+            async def refresh():
+                result = await func(*args, **kwargs)
+                if result is not None:
+                    await redis_service.set(
+                        cache_key,
+                        {"value": result, "fresh_until": time.time() + ttl},
+                        ttl + stale_ttl,
+                    )
+                return result
+
+            entry = await redis_service.get(cache_key)
+            if entry is not None:
+                if entry["fresh_until"] > time.time():
+                    return entry["value"]
+                # Stale: one caller refreshes, the others keep serving the old value
+                token = await redis_service.acquire_lock(lock_key)
+                if token is None:
+                    return entry["value"]
+                try:
+                    return await refresh()
+                finally:
+                    await redis_service.release_lock(lock_key, token)
+
+            token = await redis_service.acquire_lock(lock_key)
+            if token is None:
+                entry = await redis_service.wait_for(cache_key, lock_key)
+                if entry is not None:
+                    return entry["value"]
+                return await func(*args, **kwargs)
+            try:
+                return await refresh()
+            finally:
+                await redis_service.release_lock(lock_key, token)
+
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
@@ -1,131 +1,441 @@
 
 from typing import List, Dict, Optional
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
-from sqlalchemy.orm import Session
-from app.db import models
-from app.services.embeddings import EmbeddingService
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchValue, QueryRequest, ScoredPoint
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from app.services.embeddings import EmbeddingService, embedding_service
+from app.services.document_metadata import document_metadata_cache
+from app.services.sparse_encoder import SPARSE_VECTOR_NAME, sparse_encoder
+from app.services.vector_schema import search_params
+
+SEARCH_MODES = ("dense", "hybrid")
+# Minimum cosine similarity of a chunk used as context; fused RRF scores only rank
+MIN_RELEVANCE = 0.25
+
+
+def reciprocal_rank_fusion(result_lists: List[List[ScoredPoint]], k: int = 60, limit: int = 10) -> List[Dict]:
+    """
+    Fuse ranked lists with RRF: score(d) = sum(1 / (k + rank)).
+    Scores are normalized by the best possible value (rank 1 in every list),
+    so they stay in [0, 1] like cosine scores.
+    """
+    fused: Dict = {}
+    for list_index, points in enumerate(result_lists):
+        for rank, point in enumerate(points, 1):
+            entry = fused.setdefault(
+                point.id,
+                {"point": point, "rrf": 0.0, "scores": [None] * len(result_lists), "ranks": [None] * len(result_lists)},
+            )
+            entry["rrf"] += 1.0 / (k + rank)
+            entry["scores"][list_index] = point.score
+            entry["ranks"][list_index] = rank
+
+    best_possible = len(result_lists) / (k + 1)
+    ranked = sorted(fused.values(), key=lambda entry: entry["rrf"], reverse=True)[:limit]
+    for entry in ranked:
+        entry["rrf"] /= best_possible
+    return ranked
+
+
+def maximal_marginal_relevance(
+    candidate_vectors: List[List[float]],
+    relevance: List[float],
+    k: int,
+    lambda_mult: float = 0.7,
+    duplicate_threshold: float = 1.0,
+) -> List[int]:
+    """
+    Greedy MMR selection, returns candidate positions in selection order.
+
+    Each step picks argmax(lambda * relevance(c) - (1 - lambda) * max sim(c, selected)).
+    Relevance should be on the same [0, 1] scale as the cosine similarities.
+    Candidates at least duplicate_threshold similar to an already selected one are dropped,
+    so fewer than k positions may come back.
+    """
+    if not candidate_vectors or k <= 0:
+        return []
+
+    matrix = np.asarray(candidate_vectors, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    pairwise = matrix @ matrix.T
+    redundancy = np.full(len(matrix), -np.inf, dtype=np.float32)
+    available = np.ones(len(matrix), dtype=bool)
+
+    selected = [int(np.argmax(relevance))]
+    available[selected[0]] = False
+    while len(selected) < k:
+        redundancy = np.maximum(redundancy, pairwise[selected[-1]])
+        available &= redundancy < duplicate_threshold
+        if not available.any():
+            break
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        best = int(np.argmax(np.where(available, scores, -np.inf)))
+        selected.append(best)
+        available[best] = False
+    return selected
+
+
+def _dense_vector(point: ScoredPoint) -> Optional[List[float]]:
+    """Dense vector of a point fetched with_vectors (unnamed, or "" next to the sparse one)"""
+    if isinstance(point.vector, dict):
+        return point.vector.get("")
+    return point.vector
+
 
 class RetrievalService:
-    def __init__(self, qdrant_client: QdrantClient, embedding_service: EmbeddingService):
+    def __init__(self, embedding_service: EmbeddingService, qdrant_client: Optional[AsyncQdrantClient] = None):
         self.embedding_service = embedding_service
         self.qdrant_client = qdrant_client
-        self.collection_name = "documents"
+        self.collection_name = embedding_service.collection_name
+
+    def connect(self, qdrant_client: AsyncQdrantClient):
+        """Attach the shared Qdrant client"""
+        self.qdrant_client = qdrant_client
+
+    def _format_result(self, point: ScoredPoint, score: float) -> Dict:
+        result = {
+            "score": score,
+            "text": point.payload.get("text", ""),
+            "document_id": point.payload.get("document_id"),
+            "chunk_index": point.payload.get("chunk_index"),
+            "page_number": point.payload.get("page_number"),
+            "token_count": point.payload.get("token_count"),
+            "title": point.payload.get("title", "unknown"),
+            "is_mock": point.payload.get("is_mock_embedding", False)
+        }
+        if point.vector is not None:
+            result["vector"] = _dense_vector(point)
+        return result
+
+    def _resolve_search_mode(self, search_mode: Optional[str]) -> str:
+        mode = (search_mode or settings.RETRIEVAL_SEARCH_MODE).lower()
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}'. Available: {', '.join(SEARCH_MODES)}")
+        if mode == "hybrid" and not self.embedding_service.sparse_enabled:
+            return "dense"
+        return mode
+
+    def _user_filter(self, user_id: Optional[int]) -> Optional[Filter]:
+        if user_id is None:
+            return None
+        return Filter(must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))])
+
+    def _query_requests(
+        self,
+        query: str,
+        query_embedding: List[float],
+        limit: int,
+        score_threshold: float,
+        query_filter: Optional[Filter],
+        with_vectors: bool,
+        hybrid: bool,
+    ) -> List[QueryRequest]:
+        """Dense request, plus the BM25 request in hybrid mode (which over-fetches for fusion)"""
+        candidates = limit * 2 if hybrid else limit
+        requests = [
+            QueryRequest(
+                query=query_embedding,
+                filter=query_filter,
+                limit=candidates,
+                score_threshold=score_threshold,
+                params=search_params(),
+                with_payload=True,
+                with_vector=with_vectors,
+            )
+        ]
+        if not hybrid:
+            return requests
+
+        sparse_query = sparse_encoder.encode_query(query)
+        if sparse_query.indices:
+            requests.append(
+                QueryRequest(
+                    query=sparse_query,
+                    using=SPARSE_VECTOR_NAME,
+                    filter=query_filter,
+                    limit=candidates,
+                    with_payload=True,
+                    with_vector=with_vectors,
+                )
+            )
+        return requests
+
+    def _collect_results(self, responses: List, limit: int, hybrid: bool) -> List[Dict]:
+        """Format the responses of one query's requests, fusing them with RRF in hybrid mode"""
+        if not hybrid:
+            return [self._format_result(point, point.score) for point in responses[0].points]
+
+        fused = reciprocal_rank_fusion([response.points for response in responses], k=settings.RRF_K, limit=limit)
+        results = []
+        for entry in fused:
+            result = self._format_result(entry["point"], entry["rrf"])
+            result["dense_score"] = entry["scores"][0]
+            result["sparse_score"] = entry["scores"][1] if len(entry["scores"]) > 1 else None
+            result["sparse_rank"] = entry["ranks"][1] if len(entry["ranks"]) > 1 else None
+            results.append(result)
+        return results
+
+    def _relevance(self, chunk: Dict) -> Optional[float]:
+        """Cosine similarity to the query; None for hybrid hits found by BM25 alone"""
+        if "dense_score" in chunk:
+            return chunk["dense_score"]
+        return chunk["score"]
+
+    def _is_relevant(self, chunk: Dict) -> bool:
+        """
+        Context admission: a cosine similarity above MIN_RELEVANCE, or, for
+        hybrid hits, one of the top keyword matches (exact identifiers and
+        part numbers that dense search can miss)
+        """
+        relevance = self._relevance(chunk)
+        if relevance is not None and relevance > MIN_RELEVANCE:
+            return True
+        sparse_rank = chunk.get("sparse_rank")
+        return (
+            sparse_rank is not None
+            and sparse_rank <= settings.HYBRID_SPARSE_ADMIT_RANK
+            and chunk["sparse_score"] >= settings.HYBRID_MIN_SPARSE_SCORE
+        )
+
+    async def _hybrid_search(
+        self,
+        query: str,
+        query_embedding: List[float],
+        limit: int,
+        score_threshold: float,
+        query_filter: Optional[Filter],
+        with_vectors: bool = False,
+    ) -> List[Dict]:
+        """Dense + BM25 searches in one batched request, fused with RRF"""
+        requests = self._query_requests(
+            query, query_embedding, limit, score_threshold, query_filter, with_vectors, hybrid=True
+        )
+        responses = await self.qdrant_client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=requests,
+        )
+        return self._collect_results(responses, limit, hybrid=True)
 
     async def search_similar_chunks(
         self, 
         query: str, 
         limit: int = 10,
         score_threshold: float = 0.3,
-        user_id: Optional[int] = None
+        user_id: Optional[int] = None,
+        search_mode: Optional[str] = None,
+        with_vectors: bool = False
     ) -> List[Dict]:
         try:
             if not query.strip():
                 return []
 
-            query_embeddings = await self.embedding_service.generate_embeddings([query])
-            if not query_embeddings:
+            query_embedding = await self.embedding_service.embed_query(query)
+            if query_embedding is None:
                 return []
 
-            query_filter = None
-            if user_id is not None:
-                query_filter = Filter(
-                    must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))]
+            query_filter = self._user_filter(user_id)
+
+            if self._resolve_search_mode(search_mode) == "hybrid":
+                return await self._hybrid_search(
+                    query, query_embedding, limit, score_threshold, query_filter, with_vectors
                 )
 
-            results = self.qdrant_client.search(
+            results = await self.qdrant_client.search(
                 collection_name=self.collection_name,
-                query_vector=query_embeddings[0],
+                query_vector=query_embedding,
                 limit=limit,
                 score_threshold=score_threshold,
                 with_payload=True,
-                query_filter=query_filter
+                with_vectors=with_vectors,
+                query_filter=query_filter,
+                search_params=search_params(),
             )
 
-            formatted_results = []
-            for result in results:
-                formatted_results.append({
-                    "score": result.score,
-                    "text": result.payload.get("text", ""),
-                    "document_id": result.payload.get("document_id"),
-                    "chunk_index": result.payload.get("chunk_index"),
-                    "title": result.payload.get("title", "unknown"),
-                    "is_mock": result.payload.get("is_mock_embedding", False)
-                })
-
-            return formatted_results
+            return [self._format_result(result, result.score) for result in results]
 
         except Exception:
             return []
 
+    async def search_similar_chunks_batch(
+        self,
+        queries: List[str],
+        query_embeddings: List[Optional[List[float]]],
+        limit: int = 10,
+        score_threshold: float = 0.3,
+        user_id: Optional[int] = None,
+        search_mode: Optional[str] = None,
+        with_vectors: bool = False
+    ) -> List[List[Dict]]:
+        """Search many pre-embedded queries in a single Qdrant batch request"""
+        results: List[List[Dict]] = [[] for _ in queries]
+        try:
+            hybrid = self._resolve_search_mode(search_mode) == "hybrid"
+            query_filter = self._user_filter(user_id)
+
+            requests: List[QueryRequest] = []
+            spans = []
+            for position, (query, embedding) in enumerate(zip(queries, query_embeddings)):
+                if embedding is None or not query.strip():
+                    continue
+                query_requests = self._query_requests(
+                    query, embedding, limit, score_threshold, query_filter, with_vectors, hybrid
+                )
+                spans.append((position, len(requests), len(query_requests)))
+                requests.extend(query_requests)
+
+            if not requests:
+                return results
+
+            responses = await self.qdrant_client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=requests,
+            )
+            for position, start, count in spans:
+                results[position] = self._collect_results(responses[start:start + count], limit, hybrid)
+            return results
+
+        except Exception:
+            return results
+
+    def _select_chunks(
+        self,
+        similar_chunks: List[Dict],
+        max_chunks: int,
+        use_mmr: bool,
+        mmr_lambda: Optional[float] = None
+    ) -> List[Dict]:
+        """Keep the best (optionally diversified) chunks"""
+        similar_chunks.sort(key=lambda x: x["score"], reverse=True)
+        candidates = [chunk for chunk in similar_chunks if self._is_relevant(chunk)]
+
+        if use_mmr and candidates:
+            return self._diversify(candidates, max_chunks, mmr_lambda)
+        return candidates[:max_chunks]
+
+    def _context_result(self, query: str, best_chunks: List[Dict], metadata: Dict[int, Dict], use_mmr: bool) -> Dict:
+        if not best_chunks:
+            return {"query": query, "contexts": [], "documents": []}
+
+        used_doc_ids = dict.fromkeys(chunk["document_id"] for chunk in best_chunks)
+        # Scores are reported as cosine similarities (confidence); fused RRF values only rank
+        similarities = [score for score in map(self._relevance, best_chunks) if score is not None]
+        result = {
+            "query": query,
+            "contexts": best_chunks,
+            "documents": [metadata[doc_id] for doc_id in used_doc_ids if doc_id in metadata],
+            "total_chunks": len(best_chunks),
+            "max_score": max(similarities) if similarities else 0,
+            "min_score": min(similarities) if similarities else 0,
+            "diversified": bool(use_mmr)
+        }
+        if any("dense_score" in chunk for chunk in best_chunks):
+            result["max_fused_score"] = max(chunk["score"] for chunk in best_chunks)
+        return result
+
     async def retrieve_document_context(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         query: str, 
         max_chunks: int = 5,
-        user_id: Optional[int] = None
+        user_id: Optional[int] = None,
+        search_mode: Optional[str] = None,
+        use_mmr: Optional[bool] = None,
+        mmr_lambda: Optional[float] = None
     ) -> Dict:
         try:
+            use_mmr = settings.MMR_ENABLED if use_mmr is None else use_mmr
             similar_chunks = await self.search_similar_chunks(
                 query=query,
                 limit=max_chunks * 3,
                 score_threshold=0.1,
-                user_id=user_id
+                user_id=user_id,
+                search_mode=search_mode,
+                with_vectors=use_mmr
             )
 
-            if not similar_chunks:
-                return {"query": query, "contexts": [], "documents": []}
+            best_chunks = self._select_chunks(similar_chunks, max_chunks, use_mmr, mmr_lambda)
+            metadata = await document_metadata_cache.get_many(db, (chunk["document_id"] for chunk in best_chunks))
+            return self._context_result(query, best_chunks, metadata, use_mmr)
 
-            similar_chunks.sort(key=lambda x: x["score"], reverse=True)
-            best_chunks = similar_chunks[:max_chunks]
-            best_chunks = [chunk for chunk in best_chunks if chunk["score"] > 0.25]
-            
-            if not best_chunks:
-                return {"query": query, "contexts": [], "documents": []}
+        except Exception:
+            return {"query": query, "contexts": [], "documents": []}
 
-            used_doc_ids = list(set(chunk["document_id"] for chunk in best_chunks))
-            documents_metadata = []
-            
-            for doc_id in used_doc_ids:
-                document = db.query(models.Document).filter(models.Document.id == doc_id).first()
-                if document:
-                    documents_metadata.append({
-                        "id": document.id,
-                        "title": document.title,
-                        "file_type": document.file_type,
-                        "uploaded_at": document.uploaded_at.isoformat() if document.uploaded_at else None,
-                        "source": document.source
-                    })
-
-            return {
-                "query": query,
-                "contexts": best_chunks,
-                "documents": documents_metadata,
-                "total_chunks": len(best_chunks),
-                "max_score": max([chunk["score"] for chunk in best_chunks]) if best_chunks else 0,
-                "min_score": min([chunk["score"] for chunk in best_chunks]) if best_chunks else 0
-            }
+    async def retrieve_document_contexts(
+        self,
+        db: AsyncSession,
+        queries: List[str],
+        query_embeddings: List[Optional[List[float]]],
+        max_chunks: int = 5,
+        user_id: Optional[int] = None,
+        search_mode: Optional[str] = None,
+        use_mmr: Optional[bool] = None,
+        mmr_lambda: Optional[float] = None
+    ) -> List[Dict]:
+        """retrieve_document_context for many pre-embedded queries with one batched search"""
+        use_mmr = settings.MMR_ENABLED if use_mmr is None else use_mmr
+        similar_chunks = await self.search_similar_chunks_batch(
+            queries,
+            query_embeddings,
+            limit=max_chunks * 3,
+            score_threshold=0.1,
+            user_id=user_id,
+            search_mode=search_mode,
+            with_vectors=use_mmr
+        )
 
+        selected = [
+            self._select_chunks(chunks, max_chunks, use_mmr, mmr_lambda)
+            for chunks in similar_chunks
+        ]
+        try:
+            # One metadata lookup for the documents of every question
+            metadata = await document_metadata_cache.get_many(
+                db, (chunk["document_id"] for best_chunks in selected for chunk in best_chunks)
+            )
         except Exception:
-            return {"query": query, "contexts": [], "documents": []}
+            return [{"query": query, "contexts": [], "documents": []} for query in queries]
 
-    def format_context_for_llm(self, contexts: List[Dict]) -> str:
-        if not contexts:
-            return "No relevant context found in documents."
+        return [
+            self._context_result(query, best_chunks, metadata, use_mmr)
+            for query, best_chunks in zip(queries, selected)
+        ]
 
-        formatted_context = "## DOCUMENT CONTEXT:\n\n"
-        
-        for i, context in enumerate(contexts, 1):
-            formatted_context += f"### Document {i}: {context['title']} (Relevance score: {context['score']:.3f})\n"
-            formatted_context += f"{context['text']}\n\n"
-            formatted_context += "---\n\n"
+    def _mmr_relevance(self, candidates: List[Dict]) -> List[float]:
+        """
+        Relevance on the same [0, 1] scale as the cosine redundancy MMR subtracts:
+        cosine scores in dense mode, fused RRF scores min-max rescaled in hybrid mode
+        (BM25-only hits have no cosine score)
+        """
+        scores = np.asarray([chunk["score"] for chunk in candidates], dtype=np.float32)
+        if not any("dense_score" in chunk for chunk in candidates):
+            return scores.tolist()
+        spread = float(scores.max() - scores.min())
+        if spread <= 0:
+            return [1.0] * len(candidates)
+        return ((scores - scores.min()) / spread).tolist()
 
-        formatted_context += "## INSTRUCTIONS:\n"
-        formatted_context += "Answer the question using exclusively the context above.\n"
-        formatted_context += "Cite your sources with format: [Filename]\n"
-        formatted_context += "If information is not in context, say so clearly."
+    def _diversify(
+        self,
+        candidates: List[Dict],
+        max_chunks: int,
+        mmr_lambda: Optional[float] = None
+    ) -> List[Dict]:
+        """Re-rank candidates with MMR and drop their vectors"""
+        vectors = [chunk.pop("vector", None) for chunk in candidates]
+        if any(vector is None for vector in vectors):
+            return candidates[:max_chunks]
 
-        return formatted_context
+        selected = maximal_marginal_relevance(
+            vectors,
+            self._mmr_relevance(candidates),
+            k=max_chunks,
+            lambda_mult=settings.MMR_LAMBDA if mmr_lambda is None else mmr_lambda,
+            duplicate_threshold=settings.MMR_DUPLICATE_THRESHOLD,
+        )
+        return [candidates[position] for position in selected]
 
     async def search_in_document(
         self, 
@@ -137,8 +447,8 @@ class RetrievalService:
         try:
             from qdrant_client.models import Filter, FieldCondition, MatchValue
             
-            query_embeddings = await self.embedding_service.generate_embeddings([query])
-            if not query_embeddings:
+            query_embedding = await self.embedding_service.embed_query(query)
+            if query_embedding is None:
                 return []
 
             filters = [FieldCondition(key="document_id", match=MatchValue(value=document_id))]
@@ -147,12 +457,13 @@ class RetrievalService:
             
             query_filter = Filter(must=filters)
 
-            results = self.qdrant_client.search(
+            results = await self.qdrant_client.search(
                 collection_name=self.collection_name,
-                query_vector=query_embeddings[0],
+                query_vector=query_embedding,
                 query_filter=query_filter,
                 limit=limit,
                 with_payload=True,
+                search_params=search_params(),
             )
 
             return [
@@ -183,7 +494,7 @@ class RetrievalService:
             
             query_filter = Filter(must=filters)
 
-            scroll_response = self.qdrant_client.scroll(
+            scroll_response = await self.qdrant_client.scroll(
                 collection_name=self.collection_name,
                 scroll_filter=query_filter,
                 with_payload=True,
@@ -204,3 +515,6 @@ class RetrievalService:
 
         except Exception:
             return []
+
+
+retrieval_service = RetrievalService(embedding_service)
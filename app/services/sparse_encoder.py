@@ -0,0 +1,72 @@
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List
+
+from qdrant_client.models import SparseVector
+
+from config import settings
+
+SPARSE_VECTOR_NAME = "bm25"
+
+# Identifiers such as "AB-1234", "v2.3" or "ISO/IEC" stay whole; their parts are indexed too
+TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*", re.UNICODE)
+PART_SPLIT_RE = re.compile(r"[-./]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in into is it its of on or "
+    "that the their there these this to was were what when where which who why will with "
+    "le la les de des du un une et en est que qui dans pour par sur au aux".split()
+)
+
+
+class BM25SparseEncoder:
+    """
+    Local BM25 encoder for Qdrant sparse vectors.
+
+    Documents carry the BM25 term-frequency component; the IDF component is
+    applied server-side by the sparse vector's IDF modifier, so no corpus
+    statistics have to be maintained here. Terms are hashed to 32-bit indices.
+    """
+
+    def __init__(
+        self,
+        k1: float = settings.BM25_K1,
+        b: float = settings.BM25_B,
+        avg_doc_length: float = settings.BM25_AVG_DOC_LENGTH,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = max(1.0, avg_doc_length)
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        for match in TOKEN_RE.finditer(text.lower()):
+            token = match.group()
+            parts = PART_SPLIT_RE.split(token)
+            if len(parts) > 1:
+                tokens.append(token)
+            tokens.extend(part for part in parts if part and part not in STOPWORDS)
+        return tokens
+
+    def _index(self, term: str) -> int:
+        return zlib.crc32(term.encode("utf-8"))
+
+    def _to_sparse(self, weights: Dict[int, float]) -> SparseVector:
+        indices = sorted(weights)
+        return SparseVector(indices=indices, values=[weights[i] for i in indices])
+
+    def encode_document(self, text: str) -> SparseVector:
+        tokens = self.tokenize(text)
+        length_norm = self.k1 * (1 - self.b + self.b * len(tokens) / self.avg_doc_length)
+        weights: Dict[int, float] = {}
+        for term, tf in Counter(tokens).items():
+            index = self._index(term)
+            weights[index] = weights.get(index, 0.0) + tf * (self.k1 + 1) / (tf + length_norm)
+        return self._to_sparse(weights)
+
+    def encode_query(self, text: str) -> SparseVector:
+        return self._to_sparse({self._index(term): 1.0 for term in set(self.tokenize(text))})
+
+
+sparse_encoder = BM25SparseEncoder()
@@ -0,0 +1,51 @@
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Rough average for English text with OpenAI BPE encodings
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    """Load (and memoize) the tiktoken encoding for a model"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Encoding files could not be loaded (e.g. offline container)
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count tokens locally, falling back to a character-based estimate"""
+    if not text:
+        return 0
+
+    encoding = _get_encoding(model or "text-embedding-3-small")
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Cut text down to at most max_tokens tokens"""
+    if max_tokens <= 0 or not text:
+        return ""
+
+    encoding = _get_encoding(model or "text-embedding-3-small")
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+
+    return text[:max_tokens * CHARS_PER_TOKEN]
@@ -0,0 +1,57 @@
+from typing import Dict, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from config import settings
+from app.db import models
+from app.services.local_cache import LocalLRUCache
+
+# Column values kept per user; relationships are never cached
+USER_COLUMNS = ("id", "email", "hashed_password", "full_name", "is_active", "is_superuser", "created_at")
+
+
+class UserCache:
+    """
+    In-process TTL cache of user records keyed by token subject (email).
+
+    Hits are returned as detached User instances built from a column
+    snapshot, so no session or query is needed. Entries are invalidated
+    whenever a User row is updated or deleted through the ORM.
+    """
+
+    def __init__(
+        self,
+        max_items: int = settings.USER_CACHE_ITEMS,
+        ttl: float = settings.USER_CACHE_TTL,
+    ):
+        self._cache = LocalLRUCache(maxsize=max_items, ttl=ttl)
+
+    def get(self, email: str) -> Optional[models.User]:
+        snapshot = self._cache.get(email)
+        if snapshot is None:
+            return None
+        user = models.User(**snapshot)
+        make_transient_to_detached(user)
+        return user
+
+    def set(self, user: models.User):
+        self._cache.set(user.email, {column: getattr(user, column) for column in USER_COLUMNS})
+
+    def invalidate(self, email: str):
+        self._cache.delete(email)
+
+    def get_stats(self) -> Dict:
+        return self._cache.get_stats()
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_user(mapper, connection, target: models.User):
+    user_cache.invalidate(target.email)
+    # An email change leaves the entry cached under the old subject
+    for email in inspect(target).attrs.email.history.deleted:
+        user_cache.invalidate(email)
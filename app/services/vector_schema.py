@@ -0,0 +1,197 @@
+from typing import Dict, List, Optional, Union
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    CompressionRatio,
+    Disabled,
+    Distance,
+    HnswConfigDiff,
+    IntegerIndexParams,
+    IntegerIndexType,
+    Modifier,
+    ProductQuantization,
+    ProductQuantizationConfig,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    SparseVectorParams,
+    VectorParams,
+    VectorParamsDiff,
+)
+
+from config import settings
+from app.services.sparse_encoder import SPARSE_VECTOR_NAME
+
+# Every search, count and delete filters on these fields. user_id and
+# document_id are stored as integers, so they get exact-match (lookup) indexes
+# without the range structures nobody queries.
+PAYLOAD_INDEXES: Dict[str, IntegerIndexParams] = {
+    "user_id": IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=True, range=False),
+    "document_id": IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=True, range=False),
+}
+
+
+def hnsw_config() -> HnswConfigDiff:
+    """HNSW layout: with the tenant layout each user gets its own sub-graph"""
+    if settings.QDRANT_TENANT_LAYOUT:
+        return HnswConfigDiff(m=0, payload_m=settings.QDRANT_HNSW_PAYLOAD_M)
+    return HnswConfigDiff(m=settings.QDRANT_HNSW_M)
+
+
+def sparse_vectors_config() -> Optional[Dict[str, SparseVectorParams]]:
+    """BM25 sparse vectors; IDF is computed by Qdrant at query time"""
+    if not settings.SPARSE_VECTORS_ENABLED:
+        return None
+    return {SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)}
+
+
+async def ensure_sparse_vectors(client: AsyncQdrantClient, collection_name: str) -> bool:
+    """Check (or try to add) the sparse vector slot, returns whether hybrid search is available"""
+    if not settings.SPARSE_VECTORS_ENABLED:
+        return False
+
+    config = (await client.get_collection(collection_name)).config
+    if SPARSE_VECTOR_NAME in (config.params.sparse_vectors or {}):
+        return True
+
+    try:
+        await client.update_collection(
+            collection_name=collection_name,
+            sparse_vectors_config=sparse_vectors_config(),
+        )
+        config = (await client.get_collection(collection_name)).config
+        return SPARSE_VECTOR_NAME in (config.params.sparse_vectors or {})
+    except Exception:
+        # Older collections may not accept new vector slots; stay dense-only
+        return False
+
+
+QUANTIZATION_MODES = ("none", "scalar", "product", "binary")
+
+Quantization = Union[ScalarQuantization, ProductQuantization, BinaryQuantization]
+
+
+def quantization_config(mode: Optional[str] = None) -> Optional[Quantization]:
+    """Quantized copy of the vectors kept next to the originals (None = disabled)"""
+    mode = mode or settings.QDRANT_QUANTIZATION
+    always_ram = settings.QDRANT_QUANTIZATION_ALWAYS_RAM
+    if mode == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=always_ram)
+        )
+    if mode == "product":
+        return ProductQuantization(
+            product=ProductQuantizationConfig(
+                compression=CompressionRatio(settings.QDRANT_PQ_COMPRESSION), always_ram=always_ram
+            )
+        )
+    if mode == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=always_ram))
+    if mode == "none":
+        return None
+    raise ValueError(f"Unknown quantization mode '{mode}'. Available: {', '.join(QUANTIZATION_MODES)}")
+
+
+def search_params(mode: Optional[str] = None) -> Optional[SearchParams]:
+    """Search on the quantized vectors, rescoring an oversampled candidate set with the originals"""
+    if (mode or settings.QDRANT_QUANTIZATION) == "none":
+        return None
+    return SearchParams(
+        quantization=QuantizationSearchParams(
+            rescore=settings.QDRANT_RESCORE,
+            oversampling=settings.QDRANT_OVERSAMPLING,
+        )
+    )
+
+
+async def create_collection(
+    client: AsyncQdrantClient,
+    collection_name: str,
+    dimension: int,
+    quantization: Optional[str] = None,
+    on_disk: Optional[bool] = None,
+):
+    await client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(
+            size=dimension,
+            distance=Distance.COSINE,
+            on_disk=settings.QDRANT_VECTORS_ON_DISK if on_disk is None else on_disk,
+        ),
+        sparse_vectors_config=sparse_vectors_config(),
+        hnsw_config=hnsw_config(),
+        quantization_config=quantization_config(quantization),
+    )
+    await ensure_payload_indexes(client, collection_name)
+
+
+async def ensure_payload_indexes(client: AsyncQdrantClient, collection_name: str) -> List[str]:
+    """Create missing payload indexes, returns the fields that were indexed"""
+    existing = (await client.get_collection(collection_name)).payload_schema or {}
+    created = []
+    for field_name, schema in PAYLOAD_INDEXES.items():
+        if field_name in existing:
+            continue
+        await client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=schema,
+            wait=True,
+        )
+        created.append(field_name)
+    return created
+
+
+async def ensure_hnsw_layout(client: AsyncQdrantClient, collection_name: str) -> bool:
+    """Align the collection HNSW config with settings, returns True if it changed"""
+    current = (await client.get_collection(collection_name)).config.hnsw_config
+    target = hnsw_config()
+    if current.m == target.m and (target.payload_m is None or current.payload_m == target.payload_m):
+        return False
+    await client.update_collection(collection_name=collection_name, hnsw_config=target)
+    return True
+
+
+def _quantization_mode(config) -> str:
+    if isinstance(config, ScalarQuantization):
+        return "scalar"
+    if isinstance(config, ProductQuantization):
+        return "product"
+    if isinstance(config, BinaryQuantization):
+        return "binary"
+    return "none"
+
+
+async def ensure_storage_mode(
+    client: AsyncQdrantClient,
+    collection_name: str,
+    quantization: Optional[str] = None,
+    on_disk: Optional[bool] = None,
+) -> List[str]:
+    """Align quantization and on-disk storage with settings, returns what changed"""
+    quantization = quantization or settings.QDRANT_QUANTIZATION
+    on_disk = settings.QDRANT_VECTORS_ON_DISK if on_disk is None else on_disk
+
+    config = (await client.get_collection(collection_name)).config
+    changes = []
+
+    current_mode = _quantization_mode(config.quantization_config)
+    if current_mode != quantization:
+        await client.update_collection(
+            collection_name=collection_name,
+            quantization_config=quantization_config(quantization) or Disabled.DISABLED,
+        )
+        changes.append(f"quantization {current_mode} -> {quantization}")
+
+    if bool(config.params.vectors.on_disk) != on_disk:
+        await client.update_collection(
+            collection_name=collection_name,
+            vectors_config={"": VectorParamsDiff(on_disk=on_disk)},
+        )
+        changes.append(f"original vectors {'on disk' if on_disk else 'in RAM'}")
+
+    return changes
@@ -0,0 +1,20 @@
+from fastapi import Request
+from qdrant_client import AsyncQdrantClient
+
+from config import settings
+
+
+def create_qdrant_client() -> AsyncQdrantClient:
+    """Application-wide async Qdrant client (gRPC when QDRANT_PREFER_GRPC is set)"""
+    return AsyncQdrantClient(
+        host=settings.QDRANT_HOST,
+        port=settings.QDRANT_PORT,
+        grpc_port=settings.QDRANT_GRPC_PORT,
+        prefer_grpc=settings.QDRANT_PREFER_GRPC,
+        timeout=30,
+    )
+
+
+def get_qdrant_client(request: Request) -> AsyncQdrantClient:
+    """FastAPI dependency returning the client created in the lifespan"""
+    return request.app.state.qdrant_client
@@ -0,0 +1,97 @@
+"""
+Chunker throughput benchmark.
+
+Usage:
+    python -m benchmarks.chunking_benchmark [--file document.txt] [--pages 1000]
+
+Without --file a synthetic multi-page document is generated. For each chunker
+the script reports throughput (MB/s, chunks/s), the average chunk size in
+tokens and the share of chunks that end on a sentence boundary.
+"""
+import argparse
+import random
+import time
+from typing import List
+
+from app.services.chunking import CHUNKERS, get_chunker
+from app.services.tokenizer import count_tokens
+
+WORDS = (
+    "retrieval augmented generation document vector search answer context "
+    "embedding query chunk model latency throughput contract clause policy "
+    "invoice customer revenue quarter report section table figure"
+).split()
+
+
+def synthetic_pages(pages: int, seed: int = 42) -> List[str]:
+    rng = random.Random(seed)
+    result = []
+    for _ in range(pages):
+        paragraphs = []
+        for _ in range(rng.randint(3, 6)):
+            sentences = []
+            for _ in range(rng.randint(3, 8)):
+                words = rng.choices(WORDS, k=rng.randint(6, 28))
+                sentences.append(" ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"]))
+            paragraphs.append(" ".join(sentences))
+        result.append("\n\n".join(paragraphs))
+    return result
+
+
+def run(name: str, pages: List[str], **options) -> dict:
+    chunker = get_chunker(name, **options)
+    started = time.perf_counter()
+    chunks = []
+    for page_number, text in enumerate(pages, 1):
+        chunks.extend(chunker.feed(text, page_number))
+    chunks.extend(chunker.flush())
+    elapsed = time.perf_counter() - started
+
+    size_mb = sum(len(page) + 1 for page in pages) / 1_000_000
+    tokens = [chunk.token_count or count_tokens(chunk.text) for chunk in chunks]
+    on_boundary = sum(1 for chunk in chunks if chunk.text.rstrip()[-1:] in ".!?")
+    return {
+        "chunker": name,
+        "chunks": len(chunks),
+        "seconds": elapsed,
+        "mb_per_s": size_mb / elapsed if elapsed else 0.0,
+        "chunks_per_s": len(chunks) / elapsed if elapsed else 0.0,
+        "avg_tokens": sum(tokens) / len(tokens) if tokens else 0.0,
+        "max_tokens": max(tokens) if tokens else 0,
+        "sentence_boundary": on_boundary / len(chunks) if chunks else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="UTF-8 text file; pages split on form feeds")
+    parser.add_argument("--pages", type=int, default=1000, help="synthetic page count")
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--overlap-tokens", type=int, default=40)
+    parser.add_argument("--chunk-size", type=int, default=1000, help="fixed chunker size in characters")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as handle:
+            pages = handle.read().split("\f")
+    else:
+        pages = synthetic_pages(args.pages)
+
+    print(f"{'chunker':<10} {'chunks':>7} {'sec':>7} {'MB/s':>7} {'chunks/s':>9} {'avg tok':>8} {'max tok':>8} {'sentence end':>13}")
+    for name in CHUNKERS:
+        result = run(
+            name,
+            pages,
+            max_tokens=args.max_tokens,
+            overlap_tokens=args.overlap_tokens,
+            chunk_size=args.chunk_size,
+        )
+        print(
+            f"{result['chunker']:<10} {result['chunks']:>7} {result['seconds']:>7.2f} "
+            f"{result['mb_per_s']:>7.2f} {result['chunks_per_s']:>9.0f} {result['avg_tokens']:>8.1f} "
+            f"{result['max_tokens']:>8} {result['sentence_boundary']:>12.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
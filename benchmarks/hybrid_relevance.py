@@ -0,0 +1,129 @@
+"""
+Offline relevance check: dense vs BM25 sparse vs hybrid (RRF) retrieval.
+
+Usage:
+    python -m benchmarks.hybrid_relevance [--k 3]
+
+Loads a small built-in corpus (prose plus identifier-heavy snippets such as
+part numbers and error codes) into an in-process Qdrant collection through
+the application's EmbeddingService, then runs the labelled queries through
+RetrievalService in each search mode and prints recall@k and MRR.
+
+Dense embeddings come from OpenAI when OPENAI_API_KEY is set; without it the
+service uses its mock (random) embeddings, so the dense row is only a random
+baseline and the comparison isolates what the sparse side contributes.
+"""
+import argparse
+import asyncio
+from typing import Dict, List
+
+from qdrant_client import AsyncQdrantClient
+
+from app.services.chunking import get_chunker
+from app.services.embeddings import embedding_service
+from app.services.retrieval import retrieval_service
+from app.services.sparse_encoder import SPARSE_VECTOR_NAME, sparse_encoder
+
+CORPUS = [
+    "Replace filter cartridge FX-2210 every six months or after 500 litres of water, whichever comes first.",
+    "The pump controller reports error E-4012 when the inlet pressure drops below 0.8 bar for more than ten seconds.",
+    "Firmware v2.3.1 fixes the Bluetooth pairing timeout introduced in v2.3.0.",
+    "Our refund policy allows customers to return unused products within thirty days of delivery.",
+    "Shipping to the European Union takes three to five business days from the Rotterdam warehouse.",
+    "Gasket kit GK-77 fits all HX series heat exchangers manufactured after 2019.",
+    "Employees accrue twenty-five days of paid leave per calendar year, prorated for part-time contracts.",
+    "To reset the device, hold the power button for fifteen seconds until the LED blinks amber.",
+    "Invoice INV-2024-0193 was issued to Acme Corp for the quarterly maintenance contract.",
+    "The ISO/IEC 27001 audit is scheduled for the second week of March at the Lyon office.",
+    "Error E-4013 indicates an outlet temperature above the configured threshold.",
+    "Cartridge FX-2200 is discontinued; use FX-2210 as its direct replacement.",
+]
+
+# (query, index of the relevant passage)
+QUERIES = [
+    ("What does E-4012 mean?", 1),
+    ("how often should FX-2210 be changed", 0),
+    ("which release fixed bluetooth pairing", 2),
+    ("can I send back a product I did not use", 3),
+    ("delivery time to Europe", 4),
+    ("GK-77 compatibility", 5),
+    ("how many vacation days do staff get", 6),
+    ("how to factory reset", 7),
+    ("INV-2024-0193", 8),
+    ("when is the 27001 audit", 9),
+    ("E-4013", 10),
+    ("replacement for FX-2200", 11),
+]
+
+
+async def load_corpus():
+    client = AsyncQdrantClient(location=":memory:")
+    embedding_service.collection_name = retrieval_service.collection_name = "bench_hybrid"
+    await embedding_service.connect(client)
+    retrieval_service.connect(client)
+
+    for document_id, text in enumerate(CORPUS, 1):
+        await embedding_service.store_embeddings(
+            document_id,
+            get_chunker("sentence").chunk_text(text),
+            {"filename": f"doc-{document_id}", "user_id": 1},
+        )
+    return client
+
+
+async def evaluate(search_mode: str, k: int) -> Dict[str, float]:
+    hits, reciprocal_ranks = 0, []
+    for query, relevant in QUERIES:
+        if search_mode == "sparse":
+            ranked = await sparse_only(query, k)
+        else:
+            results = await retrieval_service.search_similar_chunks(
+                query, limit=k, score_threshold=-1.0, user_id=1, search_mode=search_mode
+            )
+            ranked = [result["document_id"] for result in results]
+
+        rank = ranked.index(relevant + 1) + 1 if relevant + 1 in ranked else None
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    return {
+        "recall": hits / len(QUERIES),
+        "mrr": sum(reciprocal_ranks) / len(QUERIES),
+    }
+
+
+async def sparse_only(query: str, k: int) -> List[int]:
+    response = await retrieval_service.qdrant_client.query_points(
+        collection_name=embedding_service.collection_name,
+        query=sparse_encoder.encode_query(query),
+        using=SPARSE_VECTOR_NAME,
+        limit=k,
+        with_payload=True,
+    )
+    return [point.payload["document_id"] for point in response.points]
+
+
+async def run(args):
+    client = await load_corpus()
+    if not embedding_service.sparse_enabled:
+        raise SystemExit("Sparse vectors are disabled (SPARSE_VECTORS_ENABLED=false)")
+
+    embeddings = "mock" if embedding_service.use_mock_embeddings else embedding_service.embedding_model
+    print(f"{len(CORPUS)} passages, {len(QUERIES)} queries, dense embeddings: {embeddings}\n")
+    print(f"| mode   | recall@{args.k} | MRR   |")
+    print("|--------|----------|-------|")
+    for mode in ("dense", "sparse", "hybrid"):
+        metrics = await evaluate(mode, args.k)
+        print(f"| {mode:<6} | {metrics['recall']:>8.2f} | {metrics['mrr']:.3f} |")
+
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3, help="Cut-off for recall@k")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
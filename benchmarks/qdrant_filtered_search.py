@@ -0,0 +1,121 @@
+"""
+Filtered-search benchmark: plain collection vs indexed tenant layout.
+
+Usage:
+    python -m benchmarks.qdrant_filtered_search [--points 1000000] [--dim 64]
+                                                [--tenants 1000] [--url http://localhost:6333]
+
+Without --url the benchmark runs against Qdrant local mode (in-process,
+":memory:" or --path). Local mode keeps everything in Python and ignores
+payload indexes and HNSW settings, so it gives the brute-force baseline; point
+--url at a server to see the effect of the indexes. Two collections are
+loaded with the same random points spread over --tenants users:
+
+- plain:   default HNSW, no payload indexes (previous layout)
+- indexed: app/services/vector_schema.py layout (payload indexes + tenant HNSW)
+
+For each, the script reports p50/p95 latency of user-filtered search and
+count. Requires the usual application environment (OPENAI_API_KEY, ...).
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Distance, FieldCondition, Filter, MatchValue, VectorParams
+
+from app.services.vector_schema import create_collection
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def load(client: AsyncQdrantClient, name: str, args, rng: np.random.Generator, indexed: bool):
+    if await client.collection_exists(name):
+        await client.delete_collection(name)
+    if indexed:
+        await create_collection(client, name, args.dim)
+    else:
+        await client.create_collection(name, vectors_config=VectorParams(size=args.dim, distance=Distance.COSINE))
+
+    started = time.perf_counter()
+    for start in range(0, args.points, args.batch):
+        size = min(args.batch, args.points - start)
+        vectors = rng.standard_normal((size, args.dim), dtype=np.float32)
+        client.upload_collection(
+            collection_name=name,
+            vectors=vectors,
+            payload=(
+                {"user_id": int(user), "document_id": int(start + i) // 200}
+                for i, user in enumerate(rng.integers(0, args.tenants, size))
+            ),
+            ids=range(start, start + size),
+            batch_size=args.batch,
+            wait=True,
+        )
+    print(f"  loaded {args.points:,} points into '{name}' in {time.perf_counter() - started:.1f}s")
+
+
+async def measure(fn: Callable[[], Awaitable], queries: int) -> Dict[str, float]:
+    latencies = []
+    for _ in range(queries):
+        started = time.perf_counter()
+        await fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "mean": statistics.mean(latencies),
+    }
+
+
+async def run(args):
+    client = AsyncQdrantClient(url=args.url, timeout=300) if args.url else AsyncQdrantClient(location=args.path)
+    rng = np.random.default_rng(7)
+
+    print(f"{'layout':<8} {'operation':<16} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, indexed in (("bench_plain", False), ("bench_indexed", True)):
+        await load(client, name, args, rng, indexed)
+
+        def user_filter() -> Filter:
+            user_id = int(rng.integers(0, args.tenants))
+            return Filter(must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))])
+
+        operations = {
+            "filtered search": lambda: client.query_points(
+                collection_name=name,
+                query=rng.standard_normal(args.dim).tolist(),
+                query_filter=user_filter(),
+                limit=args.limit,
+            ),
+            "count by user": lambda: client.count(collection_name=name, count_filter=user_filter(), exact=True),
+        }
+        for operation, fn in operations.items():
+            result = await measure(fn, args.queries)
+            print(f"{name[6:]:<8} {operation:<16} {result['p50']:>8.2f} {result['p95']:>8.2f} {result['mean']:>8.2f}")
+
+        await client.delete_collection(name)
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--tenants", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--url", help="Qdrant server URL (default: local mode)")
+    parser.add_argument("--path", default=":memory:", help="local mode storage path")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Recall / latency report for the vector storage modes.
+
+Usage:
+    python -m benchmarks.quantization_report [--url http://localhost:6333]
+        [--source documents | --points 50000 --dim 1536] [--tenants 10]
+        [--queries 200] [--limit 10]
+
+Quantization needs a Qdrant server (local mode ignores it). Vectors are either
+sampled from an existing collection (--source, real embeddings) or generated
+as clustered synthetic data and spread over --tenants users. Each mode in
+QUANTIZATION_MODES is loaded into its own temporary collection with the
+application's layout, and every query is user-filtered like the API's;
+ground truth is an exact (brute-force) search on the unquantized vectors. The report prints recall@k, p50/p95 latency and
+the estimated per-vector RAM of the search index for every mode, with and
+without rescoring.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import FieldCondition, Filter, MatchValue, QuantizationSearchParams, SearchParams
+
+from config import settings
+from app.services.vector_schema import QUANTIZATION_MODES, create_collection
+
+
+def bytes_per_vector(mode: str, dim: int) -> float:
+    """RAM needed per vector by the structure searched first"""
+    compression = int(settings.QDRANT_PQ_COMPRESSION.lstrip("x"))
+    return {
+        "none": dim * 4,
+        "scalar": dim,
+        "product": dim * 4 / compression,
+        "binary": dim / 8,
+    }[mode]
+
+
+async def sample_vectors(client: AsyncQdrantClient, source: str, count: int) -> np.ndarray:
+    vectors, offset = [], None
+    while len(vectors) < count:
+        points, offset = await client.scroll(
+            collection_name=source, limit=min(1000, count - len(vectors)),
+            offset=offset, with_vectors=True, with_payload=False,
+        )
+        vectors.extend(point.vector for point in points)
+        if offset is None:
+            break
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def synthetic_vectors(count: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((max(1, count // 500), dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.3 * rng.standard_normal((count, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+async def search_ids(client, name: str, queries: np.ndarray, tenants: int, limit: int, params: Optional[SearchParams]):
+    results, latencies = [], []
+    for i, query in enumerate(queries):
+        user_filter = Filter(must=[FieldCondition(key="user_id", match=MatchValue(value=i % tenants))])
+        started = time.perf_counter()
+        response = await client.query_points(
+            name, query=query.tolist(), query_filter=user_filter, limit=limit, search_params=params
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([point.id for point in response.points])
+    return results, latencies
+
+
+def recall(results: List[List[int]], truth: List[List[int]]) -> float:
+    return statistics.mean(len(set(r) & set(t)) / max(1, len(t)) for r, t in zip(results, truth))
+
+
+async def wait_indexed(client: AsyncQdrantClient, name: str):
+    while (await client.get_collection(name)).status != "green":
+        await asyncio.sleep(1)
+
+
+async def run(args):
+    client = AsyncQdrantClient(url=args.url, timeout=300)
+    rng = np.random.default_rng(11)
+
+    if args.source:
+        vectors = await sample_vectors(client, args.source, args.points + args.queries)
+    else:
+        vectors = synthetic_vectors(args.points + args.queries, args.dim, rng)
+    queries, data = vectors[:args.queries], vectors[args.queries:]
+    dim = data.shape[1]
+    print(f"{len(data):,} vectors, dim {dim}, {len(queries)} queries, k={args.limit}\n")
+
+    rows: List[Dict] = []
+    truth = None
+    for mode in QUANTIZATION_MODES:
+        name = f"bench_quant_{mode}"
+        if await client.collection_exists(name):
+            await client.delete_collection(name)
+        await create_collection(client, name, dim, quantization=mode, on_disk=args.on_disk)
+        client.upload_collection(
+            name, vectors=data, ids=range(len(data)),
+            payload=({"user_id": i % args.tenants} for i in range(len(data))),
+            batch_size=1000, wait=True,
+        )
+        await wait_indexed(client, name)
+
+        if truth is None:
+            truth, _ = await search_ids(client, name, queries, args.tenants, args.limit, SearchParams(exact=True))
+
+        variants = [("-", None)] if mode == "none" else [
+            ("no rescore", SearchParams(quantization=QuantizationSearchParams(rescore=False))),
+            (f"rescore x{args.oversampling:g}", SearchParams(
+                quantization=QuantizationSearchParams(rescore=True, oversampling=args.oversampling)
+            )),
+        ]
+        for label, params in variants:
+            results, latencies = await search_ids(client, name, queries, args.tenants, args.limit, params)
+            rows.append({
+                "mode": mode,
+                "search": label,
+                "recall": recall(results, truth),
+                "p50": statistics.median(latencies),
+                "p95": sorted(latencies)[int(len(latencies) * 0.95) - 1],
+                "bytes": bytes_per_vector(mode, dim),
+            })
+        await client.delete_collection(name)
+
+    await client.close()
+
+    print("| mode | search | recall@k | p50 ms | p95 ms | index bytes/vector |")
+    print("|------|--------|----------|--------|--------|--------------------|")
+    for row in rows:
+        print(
+            f"| {row['mode']} | {row['search']} | {row['recall']:.3f} | {row['p50']:.2f} | "
+            f"{row['p95']:.2f} | {row['bytes']:,.0f} |"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"http://{settings.QDRANT_HOST}:{settings.QDRANT_PORT}")
+    parser.add_argument("--source", help="sample vectors from this collection instead of synthetic data")
+    parser.add_argument("--points", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--tenants", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--oversampling", type=float, default=settings.QDRANT_OVERSAMPLING)
+    parser.add_argument("--on-disk", action="store_true", help="store original vectors on disk")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
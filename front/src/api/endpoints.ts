@@ -1,5 +1,5 @@
-import apiClient from './apiClient';
-import { Document, SearchResult, UploadResponse, ChatMessage, User } from '../types';
+import apiClient, { API_BASE_URL } from './apiClient';
+import { Document, SearchResult, UploadResponse, ChatMessage, ChatStreamHandlers, User } from '../types';
 
 export const documentsAPI = {
 
@@ -90,6 +90,67 @@ export const chatAPI = {
     return response.data;
   },
 
+  // Server-sent events: sources, then token deltas, then done (timings + citations)
+  askQuestionStream: async (
+    question: string,
+    handlers: ChatStreamHandlers,
+    maxResults: number = 5,
+    responseStyle: string = "concise"
+  ): Promise<void> => {
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${API_BASE_URL}/chat/ask/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+        ...(token ? { Authorization: `Bearer ${token}` } : {}),
+      },
+      body: JSON.stringify({
+        question,
+        max_results: maxResults,
+        response_style: responseStyle,
+        include_sources: true,
+      }),
+    });
+
+    if (!response.ok || !response.body) {
+      const detail = await response.json().catch(() => null);
+      throw new Error(detail?.detail || `Request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    const dispatch = (block: string) => {
+      let event = 'message';
+      let data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (!data) return;
+      const payload = JSON.parse(data);
+      if (event === 'sources') handlers.onSources?.(payload);
+      else if (event === 'token') handlers.onToken(payload.text);
+      else if (event === 'done') handlers.onDone?.(payload);
+      else if (event === 'error') handlers.onError?.(payload.detail);
+    };
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        dispatch(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+      }
+    }
+    if (buffer.trim()) dispatch(buffer);
+  },
+
   
   searchSimilar: async (query: string, limit: number = 10): Promise<{results: SearchResult[]}> => {
     const response = await apiClient.get(`/chat/search?query=${encodeURIComponent(query)}&limit=${limit}`);
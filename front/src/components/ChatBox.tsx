@@ -43,7 +43,7 @@ const ChatBox: React.FC = () => {
 
     const tempMessage: ChatMessage = {
       question,
-      answer: '...',
+      answer: '',
       sources: [],
       confidence: 0,
       timestamp: new Date().toISOString(),
@@ -51,15 +51,31 @@ const ChatBox: React.FC = () => {
 
     setMessages((prev) => [...prev, tempMessage]);
 
+    // Patch the in-flight (last) message as stream events arrive
+    const updateLast = (update: (message: ChatMessage) => ChatMessage) =>
+      setMessages((prev) => [...prev.slice(0, -1), update(prev[prev.length - 1])]);
+
     try {
-      const response = await chatAPI.askQuestion(question);
-      setMessages((prev) => [...prev.slice(0, -1), response]);
+      await chatAPI.askQuestionStream(question, {
+        onSources: ({ sources, confidence, context_available }) =>
+          updateLast((message) => ({ ...message, sources, confidence, context_available })),
+        onToken: (text) =>
+          updateLast((message) => ({ ...message, answer: message.answer + text })),
+        onDone: (done) =>
+          updateLast((message) => ({
+            ...message,
+            ...done,
+            question: message.question,
+            time_to_first_token: done.time_to_first_token ?? undefined,
+          })),
+        onError: (detail) => setError(detail),
+      });
     } catch (err: any) {
-      setError(err.response?.data?.detail || 'Error while generating the response');
-      setMessages((prev) => [
-        ...prev.slice(0, -1),
-        { ...tempMessage, answer: 'Sorry, something went wrong.' },
-      ]);
+      setError(err.message || 'Error while generating the response');
+      updateLast((message) => ({
+        ...message,
+        answer: message.answer || 'Sorry, something went wrong.',
+      }));
     } finally {
       setLoading(false);
     }
@@ -153,11 +169,16 @@ const ChatBox: React.FC = () => {
                     }}
                   >
                     <Typography variant="body1" sx={{ mb: 1 }}>
-                      {loading && index === messages.length - 1
-                        ? '...'
-                        : message.answer}
+                      {message.answer ||
+                        (loading && index === messages.length - 1 ? '...' : '')}
                     </Typography>
 
+                    {message.time_to_first_token && (
+                      <Typography variant="caption" color="textSecondary" display="block" sx={{ mb: 1 }}>
+                        First token in {message.time_to_first_token} · total {message.total_time}
+                      </Typography>
+                    )}
+
                     {message.confidence > 0 && (
                       <Chip
                         label={`Confidence: ${Math.round(message.confidence * 100)}%`}
@@ -237,7 +237,7 @@ const FileUpload: React.FC<FileUploadProps> = ({ onUploadSuccess }) => {
       {uploadResult && (
         <Fade in>
           <Alert
-            severity={uploadResult.processed ? 'success' : 'warning'}
+            severity={uploadResult.processed ? 'success' : uploadResult.job_id ? 'info' : 'warning'}
             icon={uploadResult.processed ? <CheckCircle /> : <Error />}
             sx={{ mt: 2 }}
             onClose={() => setUploadResult(null)}
@@ -15,6 +15,7 @@ export interface Document {
   file_type: string | null;
   file_size: number | null;
   processed: boolean;
+  status?: 'pending' | 'extracting' | 'embedding' | 'ready' | 'failed';
   uploaded_at: string;
   user_id: number;  
 }
@@ -37,15 +38,47 @@ export interface ChatMessage {
    total_time?: string;
   retrieval_time?: string;
   llm_time?: string;
+  time_to_first_token?: string;
   context_available?: boolean;
   success?: boolean;
+  cached?: boolean;
+  llm_sources?: string[];
+}
+
+export interface ChatStreamSources {
+  sources: SearchResult[];
+  confidence: number;
+  context_available: boolean;
+  retrieved_chunks?: number;
+}
+
+export interface ChatStreamDone {
+  question: string;
+  llm_sources: string[];
+  retrieval_time: string;
+  time_to_first_token: string | null;
+  llm_time: string;
+  total_time: string;
+  timestamp: string;
+  success: boolean;
+  cached?: boolean;
+}
+
+export interface ChatStreamHandlers {
+  onSources?: (payload: ChatStreamSources) => void;
+  onToken: (text: string) => void;
+  onDone?: (payload: ChatStreamDone) => void;
+  onError?: (detail: string) => void;
 }
 
 export interface UploadResponse {
   id: number;
+  job_id?: string;
+  status?: string;
   filename: string;
-  chunks_created: number;
+  chunks_created?: number;
   message: string;
   processed: boolean;
+  duplicate?: boolean;
   timestamp: string;
 }
\ No newline at end of file
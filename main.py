@@ -1,17 +1,50 @@
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.db.database import engine, Base
 from config import settings
 from app.routes import documents, chat,auth  
+from app.services.job_queue import ingestion_queue
+from app.services.embedding_cache import embedding_cache, query_embedding_cache
+from app.services.answer_cache import answer_cache
+from app.services.redis_service import redis_service
+from app.services.document_metadata import document_metadata_cache
+from app.services.user_cache import user_cache
+from app.services.password_hasher import password_hasher
+from app.services.llm_service import llm_service
+from app.services.llm_dispatcher import llm_dispatcher
+from app.services.embeddings import embedding_service
+from app.services.retrieval import retrieval_service
+from app.services.vector_store import create_qdrant_client
 
 
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    await redis_service.connect()
+
+    # One async Qdrant client shared by every service and route
+    qdrant_client = create_qdrant_client()
+    app.state.qdrant_client = qdrant_client
+    await embedding_service.connect(qdrant_client)
+    retrieval_service.connect(qdrant_client)
+
+    await ingestion_queue.start()
+    yield
+    await ingestion_queue.stop()
+    await qdrant_client.close()
+    await engine.dispose()
+    await redis_service.close()
+    password_hasher.shutdown()
 
 app = FastAPI(
     title="RAG API",
     description="API pour le système RAG (Retrieval-Augmented Generation) avec Qdrant",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -39,4 +72,19 @@ async def health_check():
         "database": "PostgreSQL",
         "vector_db": "Qdrant",
         "services": ["fastapi", "postgresql", "qdrant", "openai"]
-    }
\ No newline at end of file
+    }
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "embedding_cache": embedding_cache.get_stats(),
+        "query_embedding_cache": query_embedding_cache.get_stats(),
+        "answer_cache": answer_cache.get_stats(),
+        "document_metadata_cache": document_metadata_cache.get_stats(),
+        "user_cache": user_cache.get_stats(),
+        "redis": await redis_service.get_stats(),
+        "password_hasher": password_hasher.get_stats(),
+        "llm_streaming": llm_service.get_stats(),
+        "llm_dispatcher": llm_dispatcher.get_stats(),
+        "ingestion_queue_depth": ingestion_queue.queue_depth(),
+    }
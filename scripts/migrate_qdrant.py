@@ -0,0 +1,63 @@
+"""
+Idempotent Qdrant collection migration.
+
+Usage:
+    python -m scripts.migrate_qdrant [--collection documents] [--skip-hnsw]
+                                     [--quantization none|scalar|product|binary]
+                                     [--on-disk | --in-ram] [--skip-storage]
+
+Creates the payload indexes the API filters on (user_id, document_id), aligns
+the HNSW layout with QDRANT_TENANT_LAYOUT and the vector storage mode with
+QDRANT_QUANTIZATION / QDRANT_VECTORS_ON_DISK (or the flags above). Running it
+again is a no-op. HNSW and storage changes are applied by the server's
+optimizer in the background.
+"""
+import argparse
+import asyncio
+
+from config import settings
+from app.services.vector_schema import (
+    QUANTIZATION_MODES,
+    ensure_hnsw_layout,
+    ensure_payload_indexes,
+    ensure_storage_mode,
+)
+from app.services.vector_store import create_qdrant_client
+
+
+async def migrate(args):
+    client = create_qdrant_client()
+    try:
+        if not await client.collection_exists(args.collection):
+            print(f"Collection '{args.collection}' does not exist, nothing to migrate")
+            return
+
+        created = await ensure_payload_indexes(client, args.collection)
+        print(f"Payload indexes created: {', '.join(created) if created else 'none (already present)'}")
+
+        if not args.skip_hnsw:
+            changed = await ensure_hnsw_layout(client, args.collection)
+            print(f"HNSW layout: {'updated, re-indexing in background' if changed else 'unchanged'}")
+
+        if not args.skip_storage:
+            changes = await ensure_storage_mode(client, args.collection, args.quantization, args.on_disk)
+            print(f"Vector storage: {'; '.join(changes) if changes else 'unchanged'}")
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default=settings.QDRANT_COLLECTION)
+    parser.add_argument("--skip-hnsw", action="store_true", help="leave the HNSW layout untouched")
+    parser.add_argument("--skip-storage", action="store_true", help="leave quantization / on-disk settings untouched")
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES, default=settings.QDRANT_QUANTIZATION)
+    storage = parser.add_mutually_exclusive_group()
+    storage.add_argument("--on-disk", dest="on_disk", action="store_true", default=None)
+    storage.add_argument("--in-ram", dest="on_disk", action="store_false")
+    args = parser.parse_args()
+    asyncio.run(migrate(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import os
+
+# Settings require an API key at import time; tests never call OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
@@ -0,0 +1,93 @@
+import asyncio
+
+from app.services.answer_cache import AnswerCache
+
+
+class FakeRedis:
+    """The subset of RedisService the answer cache uses, in memory"""
+
+    def __init__(self):
+        self.values = {}
+        self.lists = {}
+        self.generation = 0
+
+    def is_connected(self):
+        return True
+
+    async def get_generation(self, namespace):
+        return self.generation
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ttl=None):
+        self.values[key] = value
+        return True
+
+    async def push_bytes(self, key, value, max_length, ttl=None):
+        self.lists.setdefault(key, []).insert(0, value)
+        del self.lists[key][max_length:]
+        return True
+
+    async def range_bytes(self, key):
+        return list(self.lists.get(key, []))
+
+
+EMBEDDING = [0.1, 0.7, 0.2, 0.4]
+PAYLOAD = {"answer": "Every six months.", "sources": []}
+
+
+def _cache() -> AnswerCache:
+    return AnswerCache(FakeRedis(), enabled=True, similarity_threshold=0.95)
+
+
+def test_same_retrieval_options_hit():
+    async def scenario():
+        cache = _cache()
+        _, namespace = await cache.lookup(1, EMBEDDING, "concise", 5, search_mode="dense", use_mmr=False)
+        await cache.store(namespace, EMBEDDING, PAYLOAD)
+        cached, _ = await cache.lookup(1, EMBEDDING, "concise", 5, search_mode="dense", use_mmr=False)
+        return cached
+
+    assert asyncio.run(scenario())["answer"] == PAYLOAD["answer"]
+
+
+def test_search_mode_change_is_a_miss():
+    async def scenario():
+        cache = _cache()
+        _, namespace = await cache.lookup(1, EMBEDDING, "concise", 5, search_mode="dense")
+        await cache.store(namespace, EMBEDDING, PAYLOAD)
+        cached, _ = await cache.lookup(1, EMBEDDING, "concise", 5, search_mode="hybrid")
+        return cached
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_mmr_options_are_part_of_the_key():
+    async def scenario():
+        cache = _cache()
+        _, namespace = await cache.lookup(1, EMBEDDING, "concise", 5, use_mmr=True, mmr_lambda=0.5)
+        await cache.store(namespace, EMBEDDING, PAYLOAD)
+        return (
+            (await cache.lookup(1, EMBEDDING, "concise", 5, use_mmr=False))[0],
+            (await cache.lookup(1, EMBEDDING, "concise", 5, use_mmr=True, mmr_lambda=0.9))[0],
+            (await cache.lookup(1, EMBEDDING, "concise", 5, use_mmr=True, mmr_lambda=0.5))[0],
+        )
+
+    without_mmr, other_lambda, same = asyncio.run(scenario())
+    assert without_mmr is None
+    assert other_lambda is None
+    assert same is not None
+
+
+def test_answer_computed_across_a_version_bump_is_not_served():
+    async def scenario():
+        cache = _cache()
+        _, namespace = await cache.lookup(1, EMBEDDING, "concise", 5)
+        # A document is deleted while the answer is being generated
+        cache.redis.generation += 1
+        await cache.store(namespace, EMBEDDING, PAYLOAD)
+        cached, _ = await cache.lookup(1, EMBEDDING, "concise", 5)
+        return cached
+
+    assert asyncio.run(scenario()) is None
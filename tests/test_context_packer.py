@@ -0,0 +1,23 @@
+from app.services.context_packer import ContextPacker
+
+
+def _chunk(title: str, score: float, text: str) -> dict:
+    return {"title": title, "score": score, "text": text, "token_count": 1}
+
+
+def test_packs_in_the_given_order():
+    packer = ContextPacker(context_window=4000, max_context_tokens=2000)
+    contexts = [_chunk("b.txt", 0.4, "second by score"), _chunk("a.txt", 0.9, "first by score")]
+
+    packed = packer.pack(contexts)
+    assert [chunk["title"] for chunk in packed.chunks] == ["b.txt", "a.txt"]
+    assert packed.text.index("b.txt") < packed.text.index("a.txt")
+
+
+def test_budget_ignores_the_payload_token_count():
+    packer = ContextPacker(context_window=4000, max_context_tokens=150, min_chunk_tokens=10)
+    contexts = [_chunk("a.txt", 0.9, "word " * 400)]
+
+    packed = packer.pack(contexts)
+    assert packed.truncated == 1
+    assert packed.tokens <= 150
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+from qdrant_client.models import ScoredPoint
+
+from app.services.retrieval import RetrievalService
+
+
+def _point(point_id: int, score: float, text: str) -> ScoredPoint:
+    return ScoredPoint(
+        id=point_id,
+        version=0,
+        score=score,
+        payload={"text": text, "document_id": 1, "chunk_index": point_id},
+    )
+
+
+def _service() -> RetrievalService:
+    return RetrievalService(SimpleNamespace(collection_name="documents", sparse_enabled=True))
+
+
+def test_hybrid_keeps_strong_bm25_only_hit():
+    service = _service()
+    dense = SimpleNamespace(points=[_point(1, 0.82, "replacement schedule for cartridges")])
+    sparse = SimpleNamespace(points=[
+        _point(2, 14.0, "part FX-2210 ships with two filters"),
+        _point(1, 9.5, "replacement schedule for cartridges"),
+    ])
+
+    results = service._collect_results([dense, sparse], limit=10, hybrid=True)
+    exact = next(result for result in results if result["chunk_index"] == 2)
+    assert exact["dense_score"] is None
+    assert exact["sparse_rank"] == 1
+
+    selected = service._select_chunks(results, max_chunks=5, use_mmr=False)
+    assert sorted(chunk["chunk_index"] for chunk in selected) == [1, 2]
+
+
+def test_hybrid_rejects_weak_bm25_only_hit():
+    service = _service()
+    dense = SimpleNamespace(points=[_point(1, 0.82, "relevant")])
+    sparse = SimpleNamespace(points=[
+        _point(10 + rank, 20.0 - rank, f"common word {rank}") for rank in range(1, 6)
+    ])
+
+    results = service._collect_results([dense, sparse], limit=10, hybrid=True)
+    selected = service._select_chunks(results, max_chunks=10, use_mmr=False)
+    assert sorted(chunk["chunk_index"] for chunk in selected) == [1, 11, 12, 13]
+
+
+def test_hybrid_confidence_is_cosine():
+    service = _service()
+    dense = SimpleNamespace(points=[_point(1, 0.82, "relevant"), _point(2, 0.4, "related")])
+    sparse = SimpleNamespace(points=[_point(1, 9.5, "relevant")])
+
+    results = service._collect_results([dense, sparse], limit=10, hybrid=True)
+    selected = service._select_chunks(results, max_chunks=5, use_mmr=False)
+    context = service._context_result("query", selected, {1: {"id": 1}}, use_mmr=False)
+    assert context["max_score"] == 0.82
+    assert context["min_score"] == 0.4
+    assert context["max_fused_score"] == 1.0
+
+
+def test_dense_mode_gates_on_cosine_score():
+    service = _service()
+    dense = SimpleNamespace(points=[_point(1, 0.6, "relevant"), _point(2, 0.2, "unrelated")])
+
+    results = service._collect_results([dense], limit=10, hybrid=False)
+    selected = service._select_chunks(results, max_chunks=5, use_mmr=False)
+    assert [chunk["chunk_index"] for chunk in selected] == [1]
+
+
+def test_mmr_relevance_rescales_fused_scores():
+    service = _service()
+    dense = SimpleNamespace(points=[_point(1, 0.82, "a"), _point(2, 0.6, "b"), _point(3, 0.5, "c")])
+    sparse = SimpleNamespace(points=[_point(1, 9.0, "a")])
+
+    results = service._collect_results([dense, sparse], limit=10, hybrid=True)
+    relevance = service._mmr_relevance(results)
+    assert relevance[0] == 1.0
+    assert min(relevance) == 0.0
+    assert all(0.0 <= value <= 1.0 for value in relevance)